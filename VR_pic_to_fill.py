@@ -5,36 +5,30 @@ Created on Mon Feb 17 20:03:00 2025
 @author: sijin
 """
 
+import argparse
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 
-def generate_perspective_frame(img, heading, fov, pitch, output_size, perspective_adjust=1.0):
-    """Generate a frame with adjustable perspective"""
-    height, width = img.shape[:2]
-    
-    # Convert angles to radians
+from shard import in_shard, panorama_key, parse_shard, write_manifest
+
+# Projection backend: "auto" uses the fused Numba kernel when numba is installed,
+# "numba" requires it, "numpy" always uses the vectorised NumPy path below.
+PROJECTION_BACKEND = os.environ.get("VR_PROJECTION_BACKEND", "auto")
+
+def projection_grid(fov, output_size, perspective_adjust=1.0):
+    """1D x / y view-plane coordinates of the output pixels"""
     fov_rad = np.radians(fov)
-    heading_rad = np.radians(heading)
-    pitch_rad = np.radians(pitch)
-    
-    # Adjust output dimensions with perspective
     output_width, output_height = output_size
-    
-    # Create perspective-adjusted meshgrid
     x = np.linspace(-np.tan(fov_rad/2), np.tan(fov_rad/2), output_width) * perspective_adjust
     y = np.linspace(-np.tan(fov_rad/2), np.tan(fov_rad/2), output_height)
-    xv, yv = np.meshgrid(x, y)
+    return x, y
 
-    # Apply perspective distortion
-    z = np.ones_like(xv) + xv**2 * 0.1  # Adjust the 0.1 factor to control perspective strength
-    norm = np.sqrt(xv**2 + yv**2 + z**2)
+def rotation_matrix(heading, pitch):
+    """Combined heading (yaw) and pitch rotation"""
+    heading_rad = np.radians(heading)
+    pitch_rad = np.radians(pitch)
     
-    x = xv / norm
-    y = yv / norm
-    z = z / norm
-
     # Enhanced rotation matrices with perspective consideration
     rot_mat_h = np.array([
         [np.cos(heading_rad), 0, -np.sin(heading_rad)],
@@ -48,7 +42,19 @@ def generate_perspective_frame(img, heading, fov, pitch, output_size, perspectiv
         [0, np.sin(pitch_rad), np.cos(pitch_rad)]
     ])
 
-    rot_mat = rot_mat_h @ rot_mat_p
+    return rot_mat_h @ rot_mat_p
+
+def compute_uv_numpy(x, y, rot_mat, width, height):
+    """Panorama sampling coordinates (u, v) for every output pixel, NumPy version"""
+    xv, yv = np.meshgrid(x, y)
+
+    # Apply perspective distortion
+    z = np.ones_like(xv) + xv**2 * 0.1  # Adjust the 0.1 factor to control perspective strength
+    norm = np.sqrt(xv**2 + yv**2 + z**2)
+    
+    x = xv / norm
+    y = yv / norm
+    z = z / norm
     
     # Apply rotation
     coords = np.stack([x, y, z], axis=-1)
@@ -61,69 +67,38 @@ def generate_perspective_frame(img, heading, fov, pitch, output_size, perspectiv
     # Convert to image coordinates
     u = (phi / (2 * np.pi) + 0.5) * width
     v = (theta / np.pi + 0.5) * height
+    return u.astype(np.float32), v.astype(np.float32)
+
+def get_uv_backend(backend=None):
+    """Resolve a backend name to a compute_uv function"""
+    backend = backend or PROJECTION_BACKEND
+    if backend == "numpy":
+        return compute_uv_numpy
+    if backend not in ("auto", "numba"):
+        raise ValueError(f"Unknown projection backend: {backend}")
+    try:
+        from projection_numba import compute_uv_numba
+    except ImportError:
+        if backend == "numba":
+            raise
+        return compute_uv_numpy
+    return compute_uv_numba
+
+def generate_perspective_frame(img, heading, fov, pitch, output_size, perspective_adjust=1.0, backend=None):
+    """Generate a frame with adjustable perspective"""
+    height, width = img.shape[:2]
+    
+    x, y = projection_grid(fov, output_size, perspective_adjust)
+    rot_mat = rotation_matrix(heading, pitch)
+    u, v = get_uv_backend(backend)(x, y, rot_mat, width, height)
 
     # Remap image with perspective consideration
-    u = u.astype(np.float32)
-    v = v.astype(np.float32)
     frame = cv2.remap(img, u, v, cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
     
     return frame
 
-def generate_main_frames(input_path, output_folder, num_frames=12):
-    """Generate only main view frames"""
-    os.makedirs(output_folder, exist_ok=True)
-    
-    # Read input image
-    img = cv2.imread(input_path)
-    if img is None:
-        raise ValueError("Could not read the image file")
-    
-    # Calculate viewing angles
-    headings = np.linspace(0, 360, num_frames, endpoint=False)
-    
-    # Main view parameters
-    main_params = {
-        'size': (1920, 1680),  # HD resolution
-        'fov': 90,             # Field of view
-        'perspective': 1.2     # Perspective adjustment
-    }
-    
-    frames = []
-    
-    for i, heading in enumerate(headings):
-        try:
-            frame = generate_perspective_frame(
-                img, 
-                heading, 
-                main_params['fov'],
-                pitch=-5,  # Slight downward tilt
-                output_size=main_params['size'],
-                perspective_adjust=main_params['perspective']
-            )
-            
-            # Save frame
-            output_path = os.path.join(output_folder, f'frame_{i:03d}.jpg')
-            cv2.imwrite(output_path, frame)
-            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            
-            print(f"Generated frame {i+1}/{num_frames}")
-            
-        except Exception as e:
-            print(f"Error processing frame {i}: {str(e)}")
-            continue
-    
-    # Show sample frame
-    if frames:
-        plt.figure(figsize=(15, 8))
-        plt.imshow(frames[0])
-        plt.title('Sample Frame')
-        plt.axis('off')
-        plt.show()
-    
-    return len(frames)
-
-def generate_main_frames(input_path, output_folder, num_frames=72):
-    """Generate only main view frames"""
+def generate_main_frames(input_path, output_folder, num_frames=72, show_sample=True):
+    """Generate only main view frames; set show_sample=False for unattended runs"""
     os.makedirs(output_folder, exist_ok=True)
     
     # Read input image
@@ -166,7 +141,8 @@ def generate_main_frames(input_path, output_folder, num_frames=72):
             continue
     
     # Show sample frame
-    if frames:
+    if frames and show_sample:
+        import matplotlib.pyplot as plt  # only needed for the interactive preview
         plt.figure(figsize=(15, 8))
         plt.imshow(frames[0])
         plt.title(f'Sample Frame - {os.path.basename(input_path)}')
@@ -175,14 +151,22 @@ def generate_main_frames(input_path, output_folder, num_frames=72):
     
     return len(frames)
 
-def process_all_images(input_base_folder):
-    """Process all panoramic images in all subfolders of the input base folder"""
+def process_all_images(input_base_folder, shard=None, show_sample=True):
+    """
+    Process all panoramic images in all subfolders of the input base folder.
+    With shard="i/N" only the panoramas hashed to shard i are processed and a
+    manifest is written for shard.verify_shards.
+    """
+    shard = parse_shard(shard)
+    
     # Get all directories in the input base folder
     subfolders = [f for f in os.listdir(input_base_folder) 
-                  if os.path.isdir(os.path.join(input_base_folder, f))]
+                  if os.path.isdir(os.path.join(input_base_folder, f)) and not f.startswith('.')]
     
     total_processed_images = 0
     total_processed_folders = 0
+    done_keys = []
+    failed_keys = []
     
     for subfolder in subfolders:
         input_folder = os.path.join(input_base_folder, subfolder)
@@ -197,7 +181,8 @@ def process_all_images(input_base_folder):
         
         # Get all jpg files in the input folder
         image_files = [f for f in os.listdir(input_folder) 
-                      if f.lower().endswith('.jpg')]
+                      if f.lower().endswith('.jpg')
+                      and in_shard(panorama_key(subfolder, os.path.splitext(f)[0]), shard)]
         
         folder_processed = 0
         
@@ -208,27 +193,44 @@ def process_all_images(input_base_folder):
             
             # Full paths
             input_path = os.path.join(input_folder, image_file)
+            key = panorama_key(subfolder, image_output_folder_name)
             
             print(f"  Processing {image_file}...")
+            num_frames = 6  # Number of frames per image
             try:
                 num_generated = generate_main_frames(
                     input_path=input_path,
                     output_folder=image_output_folder,
-                    num_frames=6  # Number of frames per image
+                    num_frames=num_frames,
+                    show_sample=show_sample
                 )
+                if num_generated < num_frames:
+                    # Frame errors are only logged by generate_main_frames; a partial panorama has to be redone
+                    raise RuntimeError(f"only {num_generated}/{num_frames} frames generated")
                 print(f"  Successfully generated {num_generated} frames for {image_file}")
                 folder_processed += 1
                 total_processed_images += 1
+                done_keys.append(key)
             except Exception as e:
                 print(f"  Error processing {image_file}: {str(e)}")
+                failed_keys.append(key)
         
         print(f"Processed {folder_processed} images in {subfolder}")
         if folder_processed > 0:
             total_processed_folders += 1
     
     print(f"\nTotal: Processed {total_processed_images} images across {total_processed_folders} folders")
+    if shard is not None:
+        write_manifest(input_base_folder, "project", shard, done_keys, failed_keys)
     return total_processed_images
-input_base_folder = r"G:\Arcanite\ARC-PENTHOUSE"
 
-# Run the processing
-total_processed = process_all_images(input_base_folder)
\ No newline at end of file
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate perspective frames from 360 panoramas")
+    parser.add_argument("input_base_folder", nargs="?", default=r"G:\Arcanite\ARC-PENTHOUSE")
+    parser.add_argument("--shard", help="Only process shard i of N, e.g. 0/4")
+    args = parser.parse_args()
+    
+    # Run the processing (no interactive preview when running as one of several shards)
+    total_processed = process_all_images(args.input_base_folder, shard=args.shard,
+                                         show_sample=args.shard is None)
\ No newline at end of file
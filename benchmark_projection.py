@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark and equivalence check of the projection backends.
+
+Runs generate_perspective_frame's u / v computation with the NumPy and the
+Numba backend on the same headings, checks that both produce the same
+sampling maps (and the same remapped frames), and reports time per frame.
+
+Usage:
+    python benchmark_projection.py                      # synthetic 4096x2048 panorama
+    python benchmark_projection.py --image pano.jpg --repeat 10
+"""
+
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from VR_pic_to_fill import compute_uv_numpy, projection_grid, rotation_matrix
+
+# Main view parameters of generate_main_frames
+OUTPUT_SIZE = (1920, 1680)
+FOV = 90
+PITCH = -5
+PERSPECTIVE = 1.2
+
+def time_backend(compute_uv, img, headings, repeat):
+    """Best-of-repeat seconds per frame for computing the maps and remapping."""
+    height, width = img.shape[:2]
+    x, y = projection_grid(FOV, OUTPUT_SIZE, PERSPECTIVE)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for heading in headings:
+            u, v = compute_uv(x, y, rotation_matrix(heading, PITCH), width, height)
+            cv2.remap(img, u, v, cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
+        elapsed = (time.perf_counter() - start) / len(headings)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def check_equivalence(compute_uv, img, headings, tolerance=1e-3):
+    """Max absolute u / v difference (pixels) and max frame difference versus NumPy."""
+    height, width = img.shape[:2]
+    x, y = projection_grid(FOV, OUTPUT_SIZE, PERSPECTIVE)
+    max_uv_diff = 0.0
+    max_pixel_diff = 0
+    for heading in headings:
+        rot_mat = rotation_matrix(heading, PITCH)
+        u_ref, v_ref = compute_uv_numpy(x, y, rot_mat, width, height)
+        u, v = compute_uv(x, y, rot_mat, width, height)
+        # u wraps around at the +-180 degree seam, compare modulo the panorama width
+        du = np.abs(u - u_ref)
+        du = np.minimum(du, width - du)
+        max_uv_diff = max(max_uv_diff, float(du.max()), float(np.abs(v - v_ref).max()))
+        frame_ref = cv2.remap(img, u_ref, v_ref, cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
+        frame = cv2.remap(img, u, v, cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
+        max_pixel_diff = max(max_pixel_diff, int(np.abs(frame.astype(np.int16) - frame_ref).max()))
+    return max_uv_diff, max_pixel_diff, max_uv_diff <= tolerance
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NumPy vs Numba projection")
+    parser.add_argument("--image", help="Equirectangular panorama (default: synthetic 4096x2048)")
+    parser.add_argument("--num-frames", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.image:
+        img = cv2.imread(args.image)
+        if img is None:
+            raise ValueError(f"Could not read the image file: {args.image}")
+    else:
+        rng = np.random.default_rng(0)
+        img = cv2.resize(rng.integers(0, 256, (256, 512, 3), dtype=np.uint8), (4096, 2048))
+    headings = np.linspace(0, 360, args.num_frames, endpoint=False)
+
+    try:
+        from projection_numba import compute_uv_numba
+    except ImportError:
+        print("numba is not installed, only the NumPy backend can be timed")
+        compute_uv_numba = None
+
+    numpy_time = time_backend(compute_uv_numpy, img, headings, args.repeat)
+    print(f"numpy: {numpy_time * 1000:.1f} ms/frame")
+    if compute_uv_numba is None:
+        return 0
+
+    # First call compiles the kernel (or loads it from the cache); keep it out of the timing
+    compute_uv_numba(*projection_grid(FOV, (8, 8)), rotation_matrix(0, 0), 8, 8)
+    numba_time = time_backend(compute_uv_numba, img, headings, args.repeat)
+    print(f"numba: {numba_time * 1000:.1f} ms/frame ({numpy_time / numba_time:.1f}x)")
+
+    max_uv_diff, max_pixel_diff, ok = check_equivalence(compute_uv_numba, img, headings)
+    print(f"max u/v difference: {max_uv_diff:.2e} px, max frame difference: {max_pixel_diff}")
+    print("Backends match" if ok else "Backends DIFFER")
+    return 0 if ok else 1
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
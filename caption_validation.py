@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Validation of generated captions.
+
+Gemini occasionally returns empty text, refusals, lists instead of a single
+paragraph, or narratives far over the requested length. validate_caption
+checks a caption against a set of rules and returns the reasons it fails, so
+only the failing items need to go back to the API instead of rerunning the
+whole captioning stage.
+
+Usage:
+    python caption_validation.py yt_dataset_gemni                  # report failing captions
+    python caption_validation.py yt_dataset_gemni --requeue        # exclude them so they are re-captioned
+    python caption_validation.py path/to/lora_dataset/P1_lora_dataset --rules vr
+"""
+
+import argparse
+import re
+import sys
+
+# Rules for the VR narrative prompt of save_data_as_lora_genmi
+# ("one-short paragraph, under 100 words", "second person perspective")
+VR_NARRATIVE_RULES = {
+    "min_chars": 80,
+    "max_chars": 1000,
+    "min_words": 30,
+    "max_words": 100,
+    "max_paragraphs": 1,
+    "min_second_person": 2,
+}
+
+# Rules for the YouTube snapshot prompt of gemni_to_generate
+# ("one-small-paragraph VR narrative", no person or word limit given)
+YOUTUBE_NARRATIVE_RULES = {
+    "min_chars": 80,
+    "max_chars": 2000,
+    "min_words": 20,
+    "max_words": 250,
+    "max_paragraphs": 1,
+    "min_second_person": 0,
+}
+
+RULE_SETS = {
+    "vr": VR_NARRATIVE_RULES,
+    "youtube": YOUTUBE_NARRATIVE_RULES,
+}
+
+REFUSAL_PATTERNS = [
+    r"\bI(?: a|')m sorry\b",
+    r"\bI apologi[sz]e\b",
+    r"\bI (?:can(?:no|')t|am unable to|'m unable to|am not able to)\b",
+    r"\bunable to (?:view|see|analy[sz]e|process|access|identify)\b",
+    r"\bas an AI\b",
+    r"\b(?:no|not an?) image (?:was |has been )?(?:provided|attached|included)\b",
+]
+_REFUSAL_RE = re.compile("|".join(REFUSAL_PATTERNS), re.IGNORECASE)
+_WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['’-][A-Za-z0-9]+)*")
+_SECOND_PERSON = {"you", "your", "yours", "yourself", "you're", "you’re", "you'll", "you’ll", "you've", "you’ve"}
+
+def validate_caption(text, rules=None):
+    """
+    Check a caption against rules (default VR_NARRATIVE_RULES).
+    Returns a list of failure reasons; an empty list means the caption is valid.
+    """
+    rules = rules or VR_NARRATIVE_RULES
+    if not isinstance(text, str) or not text.strip():
+        return ["empty"]
+    text = text.strip()
+    reasons = []
+
+    if _REFUSAL_RE.search(text):
+        reasons.append("refusal")
+
+    if len(text) < rules.get("min_chars", 0):
+        reasons.append(f"too short ({len(text)} chars)")
+    if rules.get("max_chars") and len(text) > rules["max_chars"]:
+        reasons.append(f"too long ({len(text)} chars)")
+
+    words = _WORD_RE.findall(text)
+    if len(words) < rules.get("min_words", 0):
+        reasons.append(f"too few words ({len(words)})")
+    if rules.get("max_words") and len(words) > rules["max_words"]:
+        reasons.append(f"too many words ({len(words)})")
+
+    paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if rules.get("max_paragraphs") and len(paragraphs) > rules["max_paragraphs"]:
+        reasons.append(f"{len(paragraphs)} paragraphs")
+
+    second_person = sum(1 for w in words if w.lower() in _SECOND_PERSON)
+    if second_person < rules.get("min_second_person", 0):
+        reasons.append("not in second person")
+
+    return reasons
+
+def message_list(messages):
+    """Sequence({'role', 'content'}) columns decode as a dict of lists; return a list of messages."""
+    if isinstance(messages, dict):
+        return [{'role': role, 'content': content}
+                for role, content in zip(messages['role'], messages['content'])]
+    return list(messages or [])
+
+def response_text(example):
+    """
+    The caption of a dataset row: 'response' column or the assistant message.
+    None if the row has no caption (e.g. a LoRA dataset built without the caption stage).
+    """
+    if 'response' in example:
+        return example['response']
+    for message in message_list(example.get('messages')):
+        if message['role'] == 'assistant':
+            return message['content']
+    return None
+
+def find_invalid_examples(dataset, rules=None, key='image_id'):
+    """
+    Return [(id, reasons)] for every row of dataset whose caption fails
+    validation. Rows without a caption are not checked.
+    """
+    failures = []
+    for example in dataset:
+        text = response_text(example)
+        if text is None:
+            continue
+        reasons = validate_caption(text, rules)
+        if reasons:
+            failures.append((example[key], reasons))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate generated captions in a dataset store")
+    parser.add_argument("dataset_path")
+    parser.add_argument("--rules", choices=sorted(RULE_SETS), default="youtube")
+    parser.add_argument("--requeue", action="store_true",
+                        help="Exclude failing rows from the store so the next run re-captions them")
+    args = parser.parse_args(argv)
+
+    from dataset_store import exclude_ids, load_store
+    dataset = load_store(args.dataset_path)
+    uncaptioned = sum(1 for example in dataset if response_text(example) is None)
+    if uncaptioned:
+        print(f"Skipping {uncaptioned} rows without a caption")
+    failures = find_invalid_examples(dataset, RULE_SETS[args.rules])
+    for example_id, reasons in failures:
+        print(f"{example_id}: {', '.join(reasons)}")
+    print(f"\n{len(failures)}/{len(dataset) - uncaptioned} captions failed validation")
+
+    if args.requeue and failures:
+        exclude_ids(args.dataset_path, [example_id for example_id, _ in failures])
+    return 1 if failures and not args.requeue else 0
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
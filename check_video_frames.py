@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Check of the video frame extractor on synthetic tour videos.
+
+Writes a small mp4 with cv2.VideoWriter whose scenes cut at known times, runs
+video_frames.extract_video on it and checks the kept timestamps, the category
+folder names, the max_frames / min_gap limits and that malformed time_range
+entries are skipped. parse_time_range is checked on its own as well.
+
+Usage:
+    python check_video_frames.py
+    python check_video_frames.py --keep /tmp/video_check   # keep the video and frames under this folder
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+from video_frames import category_folder_name, extract_video, parse_time_range
+
+FPS = 10
+FRAME_SIZE = (160, 96)
+DURATION = 20.0
+SCENE_CUTS = [0.0, 4.0, 8.0, 12.0, 16.0]  # seconds
+
+# Frames sampled at 2 fps, so every 5th frame of the 10 fps video is scored
+SAMPLING = {"sample_fps": 2.0, "threshold": 0.12, "min_gap": 1.0, "max_frames": 8}
+
+TIME_RANGE_CASES = [
+    ("01:05-01:40", (65.0, 100.0)),
+    ("1:05 - 1:40", (65.0, 100.0)),
+    ("00:12.5–00:19", (12.5, 19.0)),
+    ("1:00:00 to 1:00:30", (3600.0, 3630.0)),
+    ("5-9", (5.0, 9.0)),
+    ("", None),
+    (None, None),
+    (12, None),
+    ("living room", None),
+    ("01:40-01:05", None),
+    ("01:05-01:05", None),
+    ("01:05-", None),
+    ("1-2-3", None),
+    ("01:xx-02:00", None),
+    ("1:2:3:4-1:2:3:5", None),
+]
+
+def scene_frame(scene):
+    """A frame per scene that differs clearly from the others: a coarse grid of random colours."""
+    rng = np.random.default_rng(scene)
+    blocks = rng.integers(0, 256, (6, 10, 3), dtype=np.uint8)
+    return cv2.resize(blocks, FRAME_SIZE, interpolation=cv2.INTER_NEAREST)
+
+def write_synthetic_video(video_path):
+    """Write DURATION seconds of video that cuts to a new scene at each of SCENE_CUTS."""
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, FRAME_SIZE)
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a video writer for {video_path}")
+    frames = [scene_frame(scene) for scene in range(len(SCENE_CUTS))]
+    for number in range(int(DURATION * FPS)):
+        scene = sum(1 for cut in SCENE_CUTS if number / FPS >= cut) - 1
+        writer.write(frames[scene])
+    writer.release()
+
+def frame_names(timestamps):
+    """File names extract_video writes for frames at the given seconds."""
+    return [f"frame_{int(round(t * 1000)):08d}.jpg" for t in timestamps]
+
+def listed_frames(folder):
+    return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+def run_case(work_dir, name, video_path, captions, sampling, expected):
+    """Extract one captions.json into work_dir/name; expected maps folder -> kept timestamps."""
+    output_dir = os.path.join(work_dir, name)
+    os.makedirs(output_dir)
+    with open(os.path.join(output_dir, "captions.json"), 'w', encoding='utf-8') as f:
+        json.dump(captions, f)
+    written = extract_video(video_path, output_dir, sampling=dict(SAMPLING, **sampling))
+
+    problems = []
+    folders = sorted(d for d in os.listdir(output_dir) if os.path.isdir(os.path.join(output_dir, d)))
+    if folders != sorted(expected):
+        problems.append(f"{name}: folders {folders}, expected {sorted(expected)}")
+    for folder, timestamps in expected.items():
+        found = listed_frames(os.path.join(output_dir, folder))
+        if found != frame_names(timestamps):
+            problems.append(f"{name}: {folder} has {found}, expected {frame_names(timestamps)}")
+        if written.get(folder) != len(timestamps):
+            problems.append(f"{name}: reported {written.get(folder)} frames for {folder}, expected {len(timestamps)}")
+    return problems
+
+def check_time_ranges():
+    problems = []
+    for text, expected in TIME_RANGE_CASES:
+        result = parse_time_range(text)
+        if result != expected:
+            problems.append(f"parse_time_range({text!r}) = {result}, expected {expected}")
+    return problems
+
+def check_extraction(work_dir):
+    video_path = os.path.join(work_dir, "1.mp4")
+    write_synthetic_video(video_path)
+
+    problems = []
+    if category_folder_name(" living room ") != "living_room":
+        problems.append(f"category_folder_name(' living room ') = {category_folder_name(' living room ')!r}")
+
+    # One frame per scene; the ranges start mid-scene and on a cut
+    problems += run_case(work_dir, "scenes", video_path, {
+        "living room": [{"caption": "", "time_range": "00:01-00:09.5"}],
+        "kitchen": [{"caption": "", "time_range": "00:12-00:19"}],
+    }, {}, {"living_room": [1.0, 4.0, 8.0], "kitchen": [12.0, 16.0]})
+
+    # Malformed, reversed and missing time ranges are skipped without creating a folder
+    problems += run_case(work_dir, "malformed", video_path, {
+        "living room": [{"caption": "", "time_range": "living room"}],
+        "bedroom": [{"caption": "", "time_range": "00:10-00:05"}],
+        "balcony": [{"caption": ""}],
+        "kitchen": [{"caption": "", "time_range": "00:12-00:19"}],
+    }, {}, {"kitchen": [12.0, 16.0]})
+
+    # max_frames caps the frames kept per time range
+    problems += run_case(work_dir, "max_frames", video_path, {
+        "living room": [{"caption": "", "time_range": "00:00-00:19.5"}],
+    }, {"max_frames": 2}, {"living_room": [0.0, 4.0]})
+
+    # A cut less than min_gap after the last kept frame is taken at the first sample min_gap later
+    problems += run_case(work_dir, "min_gap", video_path, {
+        "living room": [{"caption": "", "time_range": "00:02-00:11"}],
+    }, {"min_gap": 3.0}, {"living_room": [2.0, 5.0, 8.0]})
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check video_frames on synthetic videos with known scene cuts")
+    parser.add_argument("--keep", help="Write the videos and frames here and keep them")
+    args = parser.parse_args(argv)
+
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="video_frames_check_", dir=args.keep)
+    try:
+        problems = check_time_ranges() + check_extraction(work_dir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for problem in problems:
+        print(f"  {problem}")
+    print("video_frames checks passed" if not problems else f"{len(problems)} video_frames checks FAILED")
+    return 0 if not problems else 1
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
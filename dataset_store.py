@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only dataset store built from Arrow shards.
+
+Instead of rebuilding and rewriting a whole dataset with save_to_disk on every
+run, new examples are saved as a new shard under <store>/shards/ and recorded
+in <store>/store_index.json together with their stable ids. Loading maps all
+shards (zero-copy) and joins them with concatenate_datasets. A combined store
+can reference the shards of other stores, so a multi-tour dataset is updated
+by linking the new shards only.
+
+A directory written by plain save_to_disk is adopted as the store's first
+shard on the first append, so existing datasets keep working. Datasets written
+before stable ids existed are adopted with adopt_saved_dataset and an id_func
+that derives each row's id; the ids are recorded in the index and put in the
+key column when the store is loaded, so the old shard is never rewritten.
+
+Rows can be excluded (e.g. captions that failed validation) without rewriting
+their shard: excluded ids are recorded per shard, skipped on load and no
+longer count as known, so the next run produces them again.
+"""
+
+import json
+import os
+
+INDEX_FILE = "store_index.json"
+SHARDS_FOLDER = "shards"
+
+def _index_path(store_dir):
+    return os.path.join(store_dir, INDEX_FILE)
+
+def is_store(path):
+    return os.path.exists(_index_path(path))
+
+def _is_saved_dataset(path):
+    return os.path.exists(os.path.join(path, "state.json"))
+
+def load_index(store_dir):
+    """Load a store's index; an empty index if the store does not exist yet."""
+    if not is_store(store_dir):
+        return {"shards": []}
+    with open(_index_path(store_dir), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_index(store_dir, index):
+    # Write then rename so a crash never leaves a half-written index
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_path = _index_path(store_dir) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=4)
+    os.replace(tmp_path, _index_path(store_dir))
+
+def _shard_abspath(store_dir, shard):
+    return os.path.normpath(os.path.join(store_dir, shard["path"]))
+
+def _adopt_saved_dataset(store_dir, key, id_func=None):
+    """
+    Register a plain save_to_disk dataset at store_dir as the store's first shard.
+    With id_func, each row's id is id_func(row) instead of its key column.
+    """
+    from datasets import load_from_disk
+    dataset = load_from_disk(store_dir)
+    shard = {"path": ".", "num_rows": len(dataset)}
+    if id_func is not None:
+        ids = [id_func(row) for row in dataset]
+        missing = sum(1 for example_id in ids if example_id is None)
+        if missing:
+            raise ValueError(f"Cannot adopt {store_dir}: no id for {missing} of {len(ids)} rows")
+        if key not in dataset.column_names or list(dataset[key]) != ids:
+            # load_store puts these ids in the key column
+            shard["rekeyed"] = True
+    elif key in dataset.column_names:
+        ids = list(dataset[key])
+    else:
+        raise ValueError(f"Cannot adopt {store_dir}: it has no '{key}' column")
+    shard["ids"] = ids
+    index = {"key": key, "shards": [shard]}
+    _save_index(store_dir, index)
+    print(f"Adopted existing dataset at {store_dir} as a store shard ({len(dataset)} examples)")
+    return index
+
+def adopt_saved_dataset(store_dir, key='image_id', id_func=None):
+    """
+    Adopt a plain save_to_disk dataset at store_dir as a store, deriving the
+    ids with id_func(row) when its key column is missing or outdated. Does
+    nothing if store_dir is already a store or holds no dataset. Raises
+    ValueError if an id cannot be derived.
+    """
+    if not is_store(store_dir) and _is_saved_dataset(store_dir):
+        _adopt_saved_dataset(store_dir, key, id_func)
+
+def _live_ids(shard):
+    excluded = set(shard.get("excluded", []))
+    return [i for i in shard["ids"] if i not in excluded]
+
+def known_ids(store_dir):
+    """Ids of all examples already in the store."""
+    if not is_store(store_dir) and _is_saved_dataset(store_dir):
+        from datasets import load_from_disk
+        dataset = load_from_disk(store_dir)
+        return set(dataset['image_id']) if 'image_id' in dataset.column_names else set()
+    ids = set()
+    for shard in load_index(store_dir)["shards"]:
+        ids.update(_live_ids(shard))
+    return ids
+
+def append_examples(store_dir, dataset, key='image_id'):
+    """
+    Save the rows of dataset whose key is not yet in the store as a new shard.
+    Existing shards are never rewritten. Returns the number of rows appended.
+    """
+    if not is_store(store_dir) and _is_saved_dataset(store_dir):
+        index = _adopt_saved_dataset(store_dir, key)
+    else:
+        index = load_index(store_dir)
+    existing = set()
+    for shard in index["shards"]:
+        existing.update(_live_ids(shard))
+
+    new_rows = []
+    seen = set()
+    for i, example_id in enumerate(dataset[key]):
+        if example_id not in existing and example_id not in seen:
+            new_rows.append(i)
+            seen.add(example_id)
+    if not new_rows:
+        print(f"No new examples for {store_dir}")
+        return 0
+    if len(new_rows) < len(dataset):
+        dataset = dataset.select(new_rows)
+
+    shard_number = len(index["shards"])
+    shard_rel_path = os.path.join(SHARDS_FOLDER, f"shard_{shard_number:05d}")
+    while os.path.exists(os.path.join(store_dir, shard_rel_path)):
+        # Leftover of an interrupted run that never made it into the index
+        shard_number += 1
+        shard_rel_path = os.path.join(SHARDS_FOLDER, f"shard_{shard_number:05d}")
+    dataset.save_to_disk(os.path.join(store_dir, shard_rel_path))
+
+    index["shards"].append({
+        "path": shard_rel_path.replace('\\', '/'),
+        "num_rows": len(dataset),
+        "ids": list(dataset[key]),
+    })
+    _save_index(store_dir, index)
+    print(f"Appended {len(dataset)} examples to {store_dir} as {shard_rel_path}")
+    return len(dataset)
+
+def exclude_ids(store_dir, ids, key='image_id'):
+    """
+    Exclude the live rows with the given ids from the store. Returns the
+    number of rows excluded.
+    """
+    if not is_store(store_dir) and _is_saved_dataset(store_dir):
+        index = _adopt_saved_dataset(store_dir, key)
+    else:
+        index = load_index(store_dir)
+    ids = set(ids)
+    count = 0
+    for shard in index["shards"]:
+        matched = ids.intersection(_live_ids(shard))
+        if matched:
+            shard["excluded"] = sorted(set(shard.get("excluded", [])) | matched)
+            count += len(matched)
+    _save_index(store_dir, index)
+    print(f"Excluded {count} examples from {store_dir}")
+    return count
+
+def rebuild_store(store_dir, dataset, key='image_id'):
+    """
+    Replace whatever is at store_dir (store or plain dataset) with dataset,
+    saved with save_to_disk and adopted as the store's only shard. A plain
+    save_to_disk over a store would leave its index and shards behind.
+    """
+    import shutil
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    dataset.save_to_disk(store_dir)
+    return _adopt_saved_dataset(store_dir, key)
+
+def _is_under(path, folder):
+    path, folder = os.path.normcase(os.path.abspath(path)), os.path.normcase(os.path.abspath(folder))
+    return path == folder or path.startswith(folder + os.sep)
+
+def link_stores(combined_dir, source_dirs):
+    """
+    Make combined_dir reference every shard of the source stores without
+    copying data. Shards already linked are skipped, apart from picking up
+    their latest ids and exclusions; links to shards a source no longer has
+    (e.g. after rebuild_store) are dropped. Returns the number of shards linked.
+    """
+    index = load_index(combined_dir)
+    source_shards = [(_shard_abspath(source_dir, shard), shard)
+                     for source_dir in source_dirs for shard in load_index(source_dir)["shards"]]
+    current = {os.path.normcase(shard_path): shard for shard_path, shard in source_shards}
+
+    # Sync linked shards first, so ids excluded at the source (e.g. requeued
+    # captions) do not block the shards that hold their replacements
+    updated = False
+    kept_shards = []
+    for linked_shard in index["shards"]:
+        shard_path = os.path.normcase(_shard_abspath(combined_dir, linked_shard))
+        shard = current.get(shard_path)
+        if shard is None:
+            if any(_is_under(shard_path, source_dir) for source_dir in source_dirs):
+                updated = True
+                continue
+        else:
+            for field, default in (("num_rows", 0), ("ids", []), ("excluded", []), ("rekeyed", False)):
+                if linked_shard.get(field, default) != shard.get(field, default):
+                    linked_shard[field] = shard.get(field, default)
+                    updated = True
+        kept_shards.append(linked_shard)
+    index["shards"] = kept_shards
+    linked = {os.path.normcase(_shard_abspath(combined_dir, s)): s for s in index["shards"]}
+
+    existing = set()
+    for shard in index["shards"]:
+        existing.update(_live_ids(shard))
+
+    added = 0
+    for shard_path, shard in source_shards:
+        if os.path.normcase(shard_path) in linked:
+            continue
+        duplicates = existing.intersection(_live_ids(shard))
+        if duplicates:
+            print(f"Warning: Skipping {shard_path}, {len(duplicates)} ids are already in {combined_dir}")
+            continue
+        os.makedirs(combined_dir, exist_ok=True)
+        linked_shard = {
+            "path": os.path.relpath(shard_path, combined_dir).replace('\\', '/'),
+            "num_rows": shard["num_rows"],
+            "ids": shard["ids"],
+            "excluded": shard.get("excluded", []),
+        }
+        if shard.get("rekeyed"):
+            linked_shard["rekeyed"] = True
+        index["shards"].append(linked_shard)
+        linked[os.path.normcase(shard_path)] = linked_shard
+        existing.update(_live_ids(shard))
+        added += 1
+    if added or updated:
+        _save_index(combined_dir, index)
+    print(f"Linked {added} new shards into {combined_dir}")
+    return added
+
+def load_store(path):
+    """
+    Load a store as one dataset by concatenating its shards. Plain
+    save_to_disk directories are loaded as they are.
+    """
+    from datasets import concatenate_datasets, load_from_disk
+    if not is_store(path):
+        return load_from_disk(path)
+    shards = []
+    index = load_index(path)
+    for shard in index["shards"]:
+        dataset = load_from_disk(_shard_abspath(path, shard))
+        if shard.get("rekeyed"):
+            key = index.get("key", "image_id")
+            columns = dataset.column_names
+            if key in columns:
+                dataset = dataset.remove_columns(key)
+            else:
+                columns = columns + [key]
+            dataset = dataset.add_column(key, shard["ids"]).select_columns(columns)
+        excluded = set(shard.get("excluded", []))
+        if excluded:
+            keep = [i for i, example_id in enumerate(shard["ids"]) if example_id not in excluded]
+            dataset = dataset.select(keep)
+        shards.append(dataset)
+    if not shards:
+        raise ValueError(f"Dataset store {path} is empty")
+    return concatenate_datasets(shards) if len(shards) > 1 else shards[0]
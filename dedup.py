@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Near-duplicate frame filtering with perceptual hashes.
+
+Adjacent headings of a panorama and consecutive YouTube snapshots are often
+almost identical, so captioning or training on all of them wastes API calls
+and dataset space. Frames are hashed (dHash / pHash in NumPy), indexed in a
+BK-tree for Hamming-distance lookups, and greedily thinned to a diverse subset.
+"""
+
+import os
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash: compare horizontally adjacent pixels of a small grayscale image.
+    Returns the hash as a Python int with hash_size * hash_size bits.
+    """
+    img = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(img, dtype=np.float32)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return _bits_to_int(bits)
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix, so that dct(x) = M @ x."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    mat = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    mat[0, :] = np.sqrt(1.0 / n)
+    return mat
+
+def phash(image, hash_size=8, highfreq_factor=4):
+    """
+    Perceptual hash: threshold the low-frequency block of a 2D DCT at its median.
+    Returns the hash as a Python int with hash_size * hash_size bits.
+    """
+    img_size = hash_size * highfreq_factor
+    img = image.convert('L').resize((img_size, img_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(img, dtype=np.float64)
+    dct = _dct_matrix(img_size)
+    coeffs = dct @ pixels @ dct.T
+    low = coeffs[:hash_size, :hash_size]
+    bits = low > np.median(low)
+    return _bits_to_int(bits)
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+def hamming_distance(a, b):
+    """Number of differing bits between two integer hashes."""
+    return bin(a ^ b).count('1')
+
+HASH_FUNCTIONS = {
+    'dhash': dhash,
+    'phash': phash,
+}
+
+def compute_hash(image_path, method='phash', hash_size=8):
+    """Hash an image file with the given method ('phash' or 'dhash')."""
+    if method not in HASH_FUNCTIONS:
+        raise ValueError(f"Unknown hash method: {method}")
+    with Image.open(image_path) as img:
+        return HASH_FUNCTIONS[method](img, hash_size=hash_size)
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance.
+    Radius queries only descend into children whose edge distance lies within
+    [d - radius, d + radius], so most of the tree is skipped for small radii.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_value, item):
+        node = (hash_value, item, {})
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def query(self, hash_value, radius):
+        """Return [(distance, item)] for all entries within radius of hash_value."""
+        results = []
+        if self.root is None:
+            return results
+        stack = [self.root]
+        while stack:
+            node_hash, item, children = stack.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= radius:
+                results.append((distance, item))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return results
+
+    def __len__(self):
+        return self.size
+
+def select_diverse_frames(image_paths, max_keep=None, threshold=10, method='phash', hash_size=8):
+    """
+    Keep frames that are not within `threshold` bits of an already kept frame.
+
+    Frames are visited in the given order, so callers control which of two
+    near-duplicates wins. Returns the kept paths, at most `max_keep` of them.
+    Unreadable images are skipped with a warning.
+    """
+    tree = BKTree()
+    kept = []
+    for path in image_paths:
+        if max_keep is not None and len(kept) >= max_keep:
+            break
+        try:
+            hash_value = compute_hash(path, method=method, hash_size=hash_size)
+        except Exception as e:
+            print(f"Warning: Could not hash {path}: {str(e)}")
+            continue
+        if tree.query(hash_value, threshold):
+            continue
+        tree.add(hash_value, path)
+        kept.append(path)
+    return kept
+
+def dedup_image_folder(folder_path, max_keep=None, threshold=10, method='phash'):
+    """
+    Select a diverse subset of the images directly inside folder_path (one room).
+    Returns the kept file names, sorted.
+    """
+    image_files = sorted(f for f in os.listdir(folder_path)
+                         if f.lower().endswith(IMAGE_EXTENSIONS))
+    paths = [os.path.join(folder_path, f) for f in image_files]
+    kept = select_diverse_frames(paths, max_keep=max_keep, threshold=threshold, method=method)
+    print(f"Kept {len(kept)}/{len(paths)} frames in {folder_path}")
+    return [os.path.basename(p) for p in kept]
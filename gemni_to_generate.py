@@ -5,29 +5,29 @@ Created on Tue Feb 25 16:45:09 2025
 @author: sijin
 """
 
-from google import genai
-from google.genai import types
-from PIL import Image
-from io import BytesIO
-
 import json
+import os
+import re
+import threading
 from pathlib import Path
-from datasets import Dataset, Features, Image, Value
-import pandas as pd
-from PIL import Image as PILImage
-import numpy as np
-
 
+from caption_validation import YOUTUBE_NARRATIVE_RULES, validate_caption
+from dataset_store import adopt_saved_dataset, append_examples, known_ids
 
-client = genai.Client(api_key='YOUR API')
-import json
-from pathlib import Path
-from datasets import Dataset, Features, Image, Value
-import pandas as pd
-from PIL import Image as PILImage
-import numpy as np
+# google.genai, datasets, pandas and PIL are imported inside the functions that
+# use them, so importing this module (e.g. from pipeline workers) stays cheap.
 
+_client = None
+_client_lock = threading.Lock()
 
+def get_client():
+    """Create the Gemini client on first use (API key from GEMINI_API_KEY)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google import genai
+            _client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY", 'YOUR API'))
+        return _client
 
 def load_captions(directory):
     """Load captions from the captions.json file in the given directory."""
@@ -48,7 +48,63 @@ def load_intro_captions(file_path):
         print(f"Warning: Could not load intro captions from {file_path}: {e}")
         return {}
 
-def create_radiology_style_dataset(base_dir, output_path, intro_captions_file):
+def generate_caption(text, image_path, model="gemini-2.0-flash"):
+    """Send one prompt and image to Gemini and return the response text."""
+    from PIL import Image as PILImage
+    img = PILImage.open(image_path)
+    response = get_client().models.generate_content(
+        model=model,
+        contents=[text, img])
+    return response.text
+
+def load_saved_caption(caption_path):
+    """Load a caption saved next to its image by an earlier run, or None."""
+    try:
+        with open(caption_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def caption_with_validation(text, image_path, caption_path, rules=None, max_attempts=3, model="gemini-2.0-flash"):
+    """
+    Return (caption, reasons) for an image. A valid caption saved at caption_path
+    is reused without calling the API; otherwise the caption is (re)generated
+    until it passes validation, at most max_attempts times. reasons is empty on
+    success and lists the last validation failures otherwise.
+    """
+    saved = load_saved_caption(caption_path)
+    if saved is not None and not validate_caption(saved, rules):
+        return saved, []
+    
+    reasons = ["not generated"]
+    for attempt in range(max_attempts):
+        response_text = generate_caption(text, image_path, model=model)
+        with open(caption_path, "w") as f:
+            json.dump(response_text, f, indent=4)
+        reasons = validate_caption(response_text, rules)
+        if not reasons:
+            return response_text, []
+        print(f"    Caption for {image_path} failed validation ({', '.join(reasons)}), "
+              f"attempt {attempt + 1}/{max_attempts}")
+    return None, reasons
+
+def youtube_image_id(source_dir, category, image_file):
+    """Stable id of a snapshot, from its apartment number, category folder and file stem."""
+    return f"dir{source_dir}_{category}_{os.path.splitext(image_file)[0]}"
+
+def legacy_youtube_image_id(example):
+    """
+    Stable id of a stored example. Older datasets used the image's position in
+    its folder ('..._0000'), so the id is derived again from the image path.
+    """
+    parts = re.split(r"[\\/]", str(example['image']))
+    if len(parts) < 2:
+        return None
+    return youtube_image_id(example['source_dir'], parts[-2], parts[-1])
+
+def create_radiology_style_dataset(base_dir, output_path, intro_captions_file,
+                                   max_images_per_category=2, dedup_threshold=10, skip_ids=None,
+                                   caption_rules=YOUTUBE_NARRATIVE_RULES, max_attempts=3):
     """
     Create a dataset similar to Radiology_mini format with direct image loading.
     
@@ -56,7 +112,20 @@ def create_radiology_style_dataset(base_dir, output_path, intro_captions_file):
         base_dir: Base directory containing numbered folders (0-17)
         output_path: Path where dataset will be saved
         intro_captions_file: Path to intro_captions.json
+        max_images_per_category: Number of distinct images captioned per category
+        dedup_threshold: Max pHash Hamming distance treated as a near-duplicate
+        skip_ids: Image ids that are already captioned; these are not sent to the API
+        caption_rules: caption_validation rules each response must pass
+        max_attempts: API calls per image before a failing caption is flagged
+    
+    Valid captions saved next to the images are reused, so rerunning only sends
+    missing and failing images to the API. Images that still fail are left out
+    of the dataset and listed in <base_dir>/caption_failures.json.
     """
+    from datasets import Dataset, Features, Value
+    import pandas as pd
+    from dedup import select_diverse_frames
+    
     base_dir = Path(base_dir)
     output_path = Path(output_path)
     
@@ -72,6 +141,7 @@ def create_radiology_style_dataset(base_dir, output_path, intro_captions_file):
         'content': [],
         'response': []
     }
+    failures = {}
     
     # Get all numbered directories
     numbered_dirs = sorted([d for d in base_dir.iterdir() if d.is_dir() and d.name.isdigit()], 
@@ -103,36 +173,44 @@ def create_radiology_style_dataset(base_dir, output_path, intro_captions_file):
                 # Get caption data for this category
                 category_caption = captions_data.get(category_display, [{"caption": "", "time_range": ""}])[0]
                 
-                # Process all images in this category
-                image_files = list(category_dir.glob("*"))
+                # Process a diverse subset of the images in this category
+                image_files = sorted(p for p in category_dir.glob("*")
+                                     if p.suffix.lower() in ['.jpg', '.jpeg', '.png'])
                 print(f"    Found {len(image_files)} images")
-                if len(image_files)>=2:
-                    image_files = image_files[0:2]
-                for idx, img_path in enumerate(image_files):
-                    if img_path.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                        # Create unique image ID including directory number
-                        img_id = f"dir{num_dir.name}_{category}_{idx:04d}"
-                        
-                        # Load and convert image to array
-                        img = PILImage.open(img_path)
-                        text = f'''Apartment Introduction: {{<image>}}Here is the introduction for Apartment {num_dir.name} : {intro_caption}
-                        Detailed Description: {category_caption.get("caption", "")}
-                        Analyze the given image and craft a compelling, immersive one-small-paragraph VR narrative about the {category_display} in this apartment that fully engages the reader’s senses. The narrative should transport the reader into the scene, incorporating vivid descriptions, dynamic action, and emotional depth. Focus on creating a sense of presence and realism, making the experience feel truly lifelike.
-                        '''
-                        response = client.models.generate_content(
-                            model="gemini-2.0-flash",
-                            contents=[text, img])
-                        print(response)
-                        image_path_without_extension = str(img_path).rsplit('.', 1)[0]
-                        with open(image_path_without_extension+".json", "w") as f:
-                            json.dump(response.text, f, indent=4)
-                        data['image'].append(img_path)
-                        data['image_id'].append(img_id)
-                        data['video_id'].append(f"video_{num_dir.name}")
-                        data['source_dir'].append(num_dir.name)
-
-                        data['content'].append(text)
-                        data['response'].append(response.text)
+                image_files = select_diverse_frames(image_files, max_keep=max_images_per_category,
+                                                    threshold=dedup_threshold)
+                print(f"    Kept {len(image_files)} distinct images")
+                for img_path in image_files:
+                    # Create unique, stable image ID including directory number
+                    img_id = youtube_image_id(num_dir.name, category, img_path.name)
+                    if skip_ids and img_id in skip_ids:
+                        continue
+                    
+                    text = f'''Apartment Introduction: {{<image>}}Here is the introduction for Apartment {num_dir.name} : {intro_caption}
+                    Detailed Description: {category_caption.get("caption", "")}
+                    Analyze the given image and craft a compelling, immersive one-small-paragraph VR narrative about the {category_display} in this apartment that fully engages the reader’s senses. The narrative should transport the reader into the scene, incorporating vivid descriptions, dynamic action, and emotional depth. Focus on creating a sense of presence and realism, making the experience feel truly lifelike.
+                    '''
+                    image_path_without_extension = str(img_path).rsplit('.', 1)[0]
+                    response_text, reasons = caption_with_validation(
+                        text, img_path, image_path_without_extension+".json",
+                        rules=caption_rules, max_attempts=max_attempts)
+                    if reasons:
+                        failures[img_id] = {"image": str(img_path), "reasons": reasons}
+                        continue
+                    print(response_text)
+                    data['image'].append(img_path)
+                    data['image_id'].append(img_id)
+                    data['video_id'].append(f"video_{num_dir.name}")
+                    data['source_dir'].append(num_dir.name)
+
+                    data['content'].append(text)
+                    data['response'].append(response_text)
+    failures_path = base_dir / "caption_failures.json"
+    with open(failures_path, 'w', encoding='utf-8') as f:
+        json.dump(failures, f, indent=4)
+    if failures:
+        print(f"\n{len(failures)} images failed caption validation, see {failures_path}")
+    
     print("\nCreating dataset...")
     # Create dataset with image feature
     features = Features({
@@ -156,24 +234,31 @@ def create_radiology_style_dataset(base_dir, output_path, intro_captions_file):
     
     return dataset
 
-base_dir = Path(r"G:\Arcanite\all_video_snapshots")
-output_path = Path("room_dataset")
-intro_captions_file = "G:/Arcanite/video_intros/intro_captions.json"
-
-# Create the dataset
-print("Starting dataset creation...")
-dataset = create_radiology_style_dataset(base_dir, output_path, intro_captions_file)
-
-# Save the dataset
-print("\nSaving dataset...")
-dataset.save_to_disk("yt_dataset_gemni")
-
-print(f"\nDataset saved successfully to {output_path / 'dataset'}")
-print("\nTo load and view the dataset:")
-print("from datasets import load_from_disk")
-print('dataset = load_from_disk("room_dataset/dataset")')
-print('# View first image and captions:')
-print('example = dataset[0]')
-print('print(f"Room caption: {example["caption"]}")')
-print('print(f"Intro caption: {example["intro_caption"]}")')
+# Main execution
+if __name__ == "__main__":
+    base_dir = Path(r"G:\Arcanite\all_video_snapshots")
+    output_path = Path("room_dataset")
+    intro_captions_file = "G:/Arcanite/video_intros/intro_captions.json"
+    store_path = "yt_dataset_gemni"
+
+    # Move a dataset saved by an earlier run to stable ids, so its images are not captioned twice
+    adopt_saved_dataset(store_path, id_func=legacy_youtube_image_id)
+
+    # Create the dataset, captioning only images that are not stored yet
+    print("Starting dataset creation...")
+    dataset = create_radiology_style_dataset(base_dir, output_path, intro_captions_file,
+                                             skip_ids=known_ids(store_path))
+
+    # Append the new examples as a new shard of the dataset store
+    print("\nSaving dataset...")
+    append_examples(store_path, dataset)
+
+    print(f"\nDataset saved successfully to {store_path}")
+    print("\nTo load and view the dataset:")
+    print("from dataset_store import load_store")
+    print(f'dataset = load_store("{store_path}")')
+    print('# View first image and captions:')
+    print('example = dataset[0]')
+    print('print(f"Room caption: {example["caption"]}")')
+    print('print(f"Intro caption: {example["intro_caption"]}")')
                             
\ No newline at end of file
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Import-time budget check for the pipeline entry points.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+and its cumulative import time is compared against IMPORT_BUDGETS_MS. Heavy
+libraries (google.genai, datasets, pandas, matplotlib, huggingface_hub) must
+stay out of module level so small incremental runs and pipeline workers start
+quickly.
+
+Usage:
+    python import_budget.py            # check all entry points
+    python import_budget.py --repeat 5 # take the best of 5 runs per module
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Budgets in milliseconds. Modules whose stage genuinely needs NumPy/OpenCV/PIL
+# get room for those; the orchestration and API modules must stay near-free.
+IMPORT_BUDGETS_MS = {
+    "pipeline": 50,
+    "gemni_to_generate": 50,
+    "save_data_as_lora_genmi": 50,
+    "make_youtube_dataset_for_hfi_final_version_genmi": 50,
+    "resize": 150,
+    "dedup": 300,
+    "VR_pic_to_fill": 500,
+    "check_video_frames": 300,
+    "video_frames": 300,
+    "tensor_export": 300,
+    "caption_validation": 50,
+    "benchmark_projection": 500,
+    "shard": 50,
+}
+
+def measure_import_ms(module, repeat=3):
+    """Best-of-repeat cumulative import time of module, in milliseconds."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=repo_dir, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Could not import {module}: {result.stderr.strip().splitlines()[-1]}")
+        cumulative_us = None
+        for line in result.stderr.splitlines():
+            # Format: "import time: self [us] | cumulative | imported package"
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == module:
+                cumulative_us = int(parts[1].strip())
+        if cumulative_us is None:
+            raise RuntimeError(f"No importtime entry found for {module}")
+        elapsed_ms = cumulative_us / 1000.0
+        best = elapsed_ms if best is None else min(best, elapsed_ms)
+    return best
+
+def check_import_budgets(budgets=None, repeat=3):
+    """Measure every module in budgets; returns a list of (module, ms, budget_ms, ok)."""
+    budgets = budgets or IMPORT_BUDGETS_MS
+    results = []
+    for module, budget_ms in budgets.items():
+        try:
+            elapsed_ms = measure_import_ms(module, repeat=repeat)
+        except Exception as e:
+            print(f"Error measuring {module}: {str(e)}")
+            results.append((module, None, budget_ms, False))
+            continue
+        results.append((module, elapsed_ms, budget_ms, elapsed_ms <= budget_ms))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import time of each entry point against its budget")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module (best is kept)")
+    args = parser.parse_args(argv)
+
+    results = check_import_budgets(repeat=args.repeat)
+    print(f"{'module':<52}{'import (ms)':>12}{'budget (ms)':>13}")
+    for module, elapsed_ms, budget_ms, ok in results:
+        elapsed_text = f"{elapsed_ms:.1f}" if elapsed_ms is not None else "n/a"
+        print(f"{module:<52}{elapsed_text:>12}{budget_ms:>13}  {'OK' if ok else 'OVER BUDGET'}")
+    failed = [r for r in results if not r[3]]
+    return 1 if failed else 0
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,18 +5,19 @@ Created on Mon Feb 24 00:12:27 2025
 @author: sijin
 """
 
-from datasets import Dataset, Features, Sequence, Value, load_from_disk
-from datasets.features.features import Image as DatasetImage  # Changed this import
-from PIL import Image
-import io
-import huggingface_hub
+import os
 
-huggingface_hub.login("")
+from caption_validation import YOUTUBE_NARRATIVE_RULES, validate_caption
+from dataset_store import load_store
+
+# datasets, huggingface_hub and PIL are imported inside the functions that need
+# them; logging in to the Hub happens only when a dataset is actually pushed.
 
 def resize_image(image_path, max_size=(518, 336)):
     """
     Resize image while maintaining aspect ratio
     """
+    from PIL import Image
     img = Image.open(image_path).convert('RGB')
     ratio = min(max_size[0] / img.size[0], max_size[1] / img.size[1])
     new_size = tuple(int(dim * ratio) for dim in img.size)
@@ -29,6 +30,10 @@ def transform_dataset_for_llama(dataset):
     for entry in dataset:
         if not entry.get('response') or entry['response'] == '':
             continue
+        reasons = validate_caption(entry['response'], YOUTUBE_NARRATIVE_RULES)
+        if reasons:
+            print(f"Skipping {entry.get('image_id')}: {', '.join(reasons)}")
+            continue
             
         try:
             # Resize image
@@ -102,8 +107,14 @@ def create_dataset():
     """
     Create and push dataset to Hugging Face Hub
     """
+    from datasets import Dataset, Features, Sequence, Value
+    from datasets.features.features import Image as DatasetImage  # Changed this import
+    import huggingface_hub
+    
+    huggingface_hub.login(os.environ.get("HF_TOKEN", ""))
+    
     print("Loading datasets from disk...")
-    dataset = load_from_disk("yt_dataset_gemni")
+    dataset = load_store("yt_dataset_gemni")
     #dataset_mat = load_from_disk("material_dataset_path")
     
     print("Transforming datasets...")
@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline orchestrator: project -> resize -> caption -> dataset -> push.
+
+Stages form a DAG and pass items through bounded queues, so resizing and
+captioning of one tour overlap with projection of the next instead of each
+script waiting for the whole corpus. Every stage runs its own pool of worker
+threads (OpenCV, NumPy, PIL and the Gemini client all release the GIL for the
+heavy work). All settings live in one JSON config; see DEFAULT_CONFIG.
+
+Usage:
+    python pipeline.py --base "G:\\Arcanite\\ARC-PENTHOUSE" --workers project=2 --workers resize=4
+    python pipeline.py --config pipeline.json --enable caption
+    python pipeline.py --print-config > pipeline.json
+    python pipeline.py --base "G:\\Arcanite\\ARC-PENTHOUSE" --shard 0/4 --disable dataset
+"""
+
+import argparse
+import copy
+import json
+import os
+import queue
+import threading
+import time
+
+from shard import in_shard, list_projects, panorama_key, parse_shard, write_manifest
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+DEFAULT_CONFIG = {
+    "base_folder": None,
+    "shard": None,
+    "queue_size": 32,
+    "stages": {
+        "project": {"enabled": True, "workers": 2, "num_frames": 6, "dedup_threshold": 10},
+        "resize": {"enabled": True, "workers": 4, "max_size": [640, 360]},
+        "caption": {"enabled": False, "workers": 4, "model": "gemini-2.0-flash",
+                    "rules": "vr", "max_attempts": 3},
+        "dataset": {"enabled": True, "workers": 1, "incremental": True},
+        "push": {"enabled": False, "workers": 1, "repo_id": None},
+    },
+}
+
+# Stage order of the default DAG, each stage depending on the previous enabled one
+STAGE_ORDER = ["project", "resize", "caption", "dataset", "push"]
+
+_DONE = object()
+
+def load_config(config_path=None):
+    """Load a JSON config and merge it over DEFAULT_CONFIG."""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if config_path:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            user_config = json.load(f)
+        for key, value in user_config.items():
+            if key == "stages":
+                for stage_name, stage_config in value.items():
+                    config["stages"].setdefault(stage_name, {}).update(stage_config)
+            else:
+                config[key] = value
+    return config
+
+class Stage:
+    """
+    One node of the pipeline DAG.
+
+    func(item) returns an iterable of output items for each input item.
+    finalize(), if given, runs once after all inputs are consumed and returns
+    further output items; reduce-style stages (dataset, push) emit from there.
+    """
+
+    def __init__(self, name, func, workers=1, depends_on=(), finalize=None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.depends_on = list(depends_on)
+        self.finalize = finalize
+
+class Pipeline:
+    """Runs a DAG of stages with bounded queues between them."""
+
+    def __init__(self, stages, queue_size=32):
+        self.stages = {stage.name: stage for stage in stages}
+        self.queue_size = queue_size
+        self.order = self._topological_order()
+        self.children = {name: [] for name in self.stages}
+        for stage in self.stages.values():
+            for parent in stage.depends_on:
+                self.children[parent].append(stage.name)
+
+    def _topological_order(self):
+        order = []
+        visiting = set()
+        visited = set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a cycle through stage '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage dependency '{name}'")
+            visiting.add(name)
+            for parent in self.stages[name].depends_on:
+                visit(parent)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def run(self, source_items):
+        """Feed source_items into the root stages and block until every stage has finished."""
+        queues = {name: queue.Queue(maxsize=self.queue_size) for name in self.stages}
+        pending_parents = {name: len(stage.depends_on) for name, stage in self.stages.items()}
+        stats = {name: {"processed": 0, "errors": 0, "emitted": 0} for name in self.stages}
+        lock = threading.Lock()
+        roots = [name for name in self.order if not self.stages[name].depends_on]
+
+        def emit(targets, item):
+            for target in targets:
+                queues[target].put(item)
+
+        def close(targets):
+            # A stage's input closes once all of its parents have finished
+            for target in targets:
+                with lock:
+                    pending_parents[target] -= 1
+                    closed = pending_parents[target] == 0
+                if closed:
+                    for _ in range(self.stages[target].workers):
+                        queues[target].put(_DONE)
+
+        def worker(stage):
+            while True:
+                item = queues[stage.name].get()
+                if item is _DONE:
+                    return
+                try:
+                    outputs = list(stage.func(item) or [])
+                except Exception as e:
+                    print(f"[{stage.name}] Error processing {describe_item(item)}: {str(e)}")
+                    with lock:
+                        stats[stage.name]["errors"] += 1
+                    continue
+                with lock:
+                    stats[stage.name]["processed"] += 1
+                    stats[stage.name]["emitted"] += len(outputs)
+                for output in outputs:
+                    emit(self.children[stage.name], output)
+
+        def supervise(stage, threads):
+            for t in threads:
+                t.join()
+            if stage.finalize is not None:
+                try:
+                    outputs = list(stage.finalize() or [])
+                except Exception as e:
+                    print(f"[{stage.name}] Error finalizing stage: {str(e)}")
+                    outputs = []
+                    with lock:
+                        stats[stage.name]["errors"] += 1
+                with lock:
+                    stats[stage.name]["emitted"] += len(outputs)
+                for output in outputs:
+                    emit(self.children[stage.name], output)
+            print(f"[{stage.name}] finished: {stats[stage.name]}")
+            close(self.children[stage.name])
+
+        start = time.time()
+        supervisors = []
+        for name in self.order:
+            stage = self.stages[name]
+            threads = [threading.Thread(target=worker, args=(stage,), name=f"{name}-{i}", daemon=True)
+                       for i in range(stage.workers)]
+            for t in threads:
+                t.start()
+            supervisor = threading.Thread(target=supervise, args=(stage, threads), daemon=True)
+            supervisor.start()
+            supervisors.append(supervisor)
+
+        for item in source_items:
+            emit(roots, item)
+        for name in roots:
+            for _ in range(self.stages[name].workers):
+                queues[name].put(_DONE)
+
+        for supervisor in supervisors:
+            supervisor.join()
+
+        print(f"\nPipeline finished in {time.time() - start:.1f}s")
+        return stats
+
+def describe_item(item):
+    if isinstance(item, dict):
+        for key in ("resized_path", "frame_path", "panorama", "dataset_path", "project"):
+            if key in item:
+                return str(item[key])
+    return repr(item)
+
+def discover_panoramas(base_folder, shard=None):
+    """
+    Yield one item per panorama, using the same layout as VR_pic_to_fill.process_all_images.
+    With a shard (i, N) only the panoramas hashed to shard i are yielded.
+    """
+    for subfolder in list_projects(base_folder):
+        input_folder = os.path.join(base_folder, subfolder)
+        for image_file in sorted(os.listdir(input_folder)):
+            key = panorama_key(subfolder, os.path.splitext(image_file)[0])
+            if image_file.lower().endswith('.jpg') and in_shard(key, shard):
+                yield {
+                    "key": key,
+                    "project": subfolder,
+                    "panorama": os.path.join(input_folder, image_file),
+                    "panorama_name": os.path.splitext(image_file)[0],
+                }
+
+class ProjectContext:
+    """Per-project room descriptions, materials and stored example ids, loaded once and shared by workers."""
+
+    def __init__(self, base_folder):
+        self.base_folder = base_folder
+        self._cache = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def dataset_path(self, project):
+        return os.path.join(self.base_folder, "lora_dataset", f"{project}_lora_dataset")
+
+    def _load_ids(self, project):
+        with self._lock:
+            if project not in self._ids:
+                from dataset_store import is_store, known_ids, load_store
+                from save_data_as_lora_genmi import adopt_lora_dataset
+                from caption_validation import response_text
+                path = self.dataset_path(project)
+                if os.path.exists(path) and (is_store(path) or adopt_lora_dataset(path, self.base_folder)):
+                    stored = known_ids(path)
+                    rows = load_store(path).select_columns(['image_id', 'messages']) if stored else []
+                    captioned = {row['image_id'] for row in rows if response_text(row) is not None}
+                    self._ids[project] = (stored, captioned)
+                else:
+                    # Nothing stored yet, or a dataset the dataset stage has to rebuild
+                    self._ids[project] = (set(), set())
+            return self._ids[project]
+
+    def stored_ids(self, project):
+        """Ids of all examples in the project's dataset store."""
+        return self._load_ids(project)[0]
+
+    def captioned_ids(self, project):
+        """Ids of stored examples that already have an assistant caption."""
+        return self._load_ids(project)[1]
+
+    def get(self, project):
+        with self._lock:
+            if project not in self._cache:
+                from save_data_as_lora_genmi import load_descriptions, load_materials
+                project_path = os.path.join(self.base_folder, project)
+                self._cache[project] = (
+                    load_descriptions(os.path.join(project_path, "dep.xlsx")),
+                    load_materials(os.path.join(project_path, "material.xlsx")),
+                )
+            return self._cache[project]
+
+def build_pipeline(config):
+    """Build the default project -> resize -> caption -> dataset -> push DAG from config."""
+    base_folder = config["base_folder"]
+    shard = parse_shard(config.get("shard"))
+    stage_configs = config["stages"]
+    contexts = ProjectContext(base_folder)
+    stages = []
+    previous = None
+
+    # Panorama keys seen / failed per stage, for the shard manifests
+    progress = {name: (set(), set()) for name in ("project", "resize")}
+    progress_lock = threading.Lock()
+
+    def track(stage_name, func):
+        def tracked(item):
+            with progress_lock:
+                progress[stage_name][0].add(item["key"])
+            try:
+                return func(item)
+            except Exception:
+                with progress_lock:
+                    progress[stage_name][1].add(item["key"])
+                raise
+        return tracked
+
+    def manifest_writer(stage_name):
+        def finalize():
+            seen, failed = progress[stage_name]
+            write_manifest(base_folder, stage_name, shard, seen - failed, failed)
+            return []
+        return finalize
+
+    def project(item):
+        from VR_pic_to_fill import generate_main_frames
+        from dedup import select_diverse_frames
+        cfg = stage_configs["project"]
+        frames_folder = os.path.join(base_folder, item["project"], f"{item['project']}_frames",
+                                     item["panorama_name"])
+        num_generated = generate_main_frames(item["panorama"], frames_folder,
+                                             num_frames=cfg["num_frames"], show_sample=False)
+        if num_generated < cfg["num_frames"]:
+            # Counted as failed in the shard manifest, so verify does not report the panorama as done
+            raise RuntimeError(f"only {num_generated}/{cfg['num_frames']} frames generated")
+        frame_paths = [os.path.join(frames_folder, f) for f in sorted(os.listdir(frames_folder))
+                       if f.lower().endswith(IMAGE_EXTENSIONS)]
+        if cfg.get("dedup_threshold") is not None:
+            frame_paths = select_diverse_frames(frame_paths, threshold=cfg["dedup_threshold"])
+        return [dict(item, frame_path=p) for p in frame_paths]
+
+    def resize(item):
+        from resize import resize_image
+        cfg = stage_configs["resize"]
+        file = os.path.basename(item["frame_path"])
+        resized_path = os.path.join(base_folder, item["project"], "resize", item["panorama_name"], file)
+        if not resize_image(item["frame_path"], resized_path, max_size=tuple(cfg["max_size"])):
+            raise RuntimeError("resize failed")
+        return [dict(item, resized_path=resized_path)]
+
+    def example_for(item):
+        from save_data_as_lora_genmi import build_llama_example
+        descriptions, materials = contexts.get(item["project"])
+        image_path = item.get("resized_path") or item["frame_path"]
+        return build_llama_example(os.path.basename(image_path), item["panorama_name"],
+                                   item["project"], base_folder, descriptions, materials)
+
+    incremental = stage_configs["dataset"].get("incremental", False)
+
+    def caption(item):
+        from gemni_to_generate import caption_with_validation
+        from caption_validation import RULE_SETS
+        cfg = stage_configs["caption"]
+        example = example_for(item)
+        if incremental and example['image_id'] in contexts.captioned_ids(item["project"]):
+            # Already captioned in the dataset store; the dataset stage will drop it too
+            return [item]
+        image_path = item.get("resized_path") or item["frame_path"]
+        # Valid captions from earlier runs are reused from the .json next to the image
+        response_text, reasons = caption_with_validation(
+            example['messages'][0]['content'], image_path, os.path.splitext(image_path)[0] + ".json",
+            rules=RULE_SETS[cfg.get("rules", "vr")], max_attempts=cfg.get("max_attempts", 3), model=cfg["model"])
+        if reasons:
+            # Left out of the dataset, so the next incremental run re-queues it
+            raise RuntimeError(f"caption failed validation: {', '.join(reasons)}")
+        example['messages'].append({'role': 'assistant', 'content': response_text})
+        return [dict(item, example=example)]
+
+    collected = {}
+    collected_lock = threading.Lock()
+
+    def dataset(item):
+        example = item.get("example") or example_for(item)
+        with collected_lock:
+            collected.setdefault(item["project"], []).append(example)
+        return []
+
+    def dataset_finalize():
+        from save_data_as_lora_genmi import adopt_lora_dataset, llama_examples_to_dataset
+        from dataset_store import append_examples, exclude_ids, is_store, link_stores, rebuild_store
+        lora_dataset_path = os.path.join(base_folder, "lora_dataset")
+        os.makedirs(lora_dataset_path, exist_ok=True)
+        outputs = []
+        for project_name in sorted(collected):
+            examples = sorted(collected[project_name], key=lambda e: e['image_path'])
+            dataset_output_path = contexts.dataset_path(project_name)
+            if incremental and adopt_lora_dataset(dataset_output_path, base_folder):
+                # Stored rows without a caption (e.g. from a run with the caption stage
+                # disabled) are replaced by their newly captioned examples
+                uncaptioned = contexts.stored_ids(project_name) - contexts.captioned_ids(project_name)
+                replaced = [e['image_id'] for e in examples
+                            if len(e['messages']) > 1 and e['image_id'] in uncaptioned]
+                if replaced:
+                    exclude_ids(dataset_output_path, replaced)
+                append_examples(dataset_output_path, llama_examples_to_dataset(examples))
+            else:
+                rebuild_store(dataset_output_path, llama_examples_to_dataset(examples))
+                print(f"Dataset for {project_name} created with {len(examples)} examples")
+            outputs.append({"project": project_name, "dataset_path": dataset_output_path})
+        combined_path = os.path.join(lora_dataset_path, "combined_lora_dataset")
+        if outputs and incremental:
+            link_stores(combined_path, [o["dataset_path"] for o in outputs])
+            outputs = [{"project": None, "dataset_path": combined_path}]
+        elif outputs and is_store(combined_path):
+            # Keep an existing combined store in sync with the rebuilt datasets
+            link_stores(combined_path, [o["dataset_path"] for o in outputs])
+        return outputs
+
+    dataset_paths = []
+
+    def push(item):
+        dataset_paths.append(item["dataset_path"])
+        return []
+
+    def push_finalize():
+        from datasets import concatenate_datasets
+        from dataset_store import load_store
+        repo_id = stage_configs["push"].get("repo_id")
+        if not repo_id:
+            raise ValueError("stages.push.repo_id must be set to push to the Hub")
+        if not dataset_paths:
+            print("No datasets to push")
+            return []
+        combined = concatenate_datasets([load_store(p) for p in sorted(dataset_paths)])
+        print(f"Pushing {len(combined)} examples to {repo_id}...")
+        combined.push_to_hub(repo_id)
+        return []
+
+    funcs = {
+        "project": (project, None),
+        "resize": (resize, None),
+        "caption": (caption, None),
+        "dataset": (dataset, dataset_finalize),
+        "push": (push, push_finalize),
+    }
+    for name in STAGE_ORDER:
+        cfg = stage_configs[name]
+        if not cfg.get("enabled", True):
+            continue
+        func, finalize = funcs[name]
+        if shard is not None and name in progress:
+            func, finalize = track(name, func), manifest_writer(name)
+        stages.append(Stage(name, func, workers=cfg.get("workers", 1),
+                            depends_on=[previous] if previous else [], finalize=finalize))
+        previous = name
+    return Pipeline(stages, queue_size=config["queue_size"])
+
+def source_items(config):
+    """Items fed into the first enabled stage."""
+    stage_configs = config["stages"]
+    base_folder = config["base_folder"]
+    panoramas = discover_panoramas(base_folder, parse_shard(config.get("shard")))
+    if stage_configs["project"].get("enabled", True):
+        return panoramas
+    # Projection skipped: start from frames already on disk
+    items = []
+    for item in panoramas:
+        frames_folder = os.path.join(base_folder, item["project"], f"{item['project']}_frames",
+                                     item["panorama_name"])
+        if not os.path.isdir(frames_folder):
+            continue
+        for f in sorted(os.listdir(frames_folder)):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                items.append(dict(item, frame_path=os.path.join(frames_folder, f)))
+    return items
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the VR property dataset pipeline")
+    parser.add_argument("--config", help="JSON config file merged over the defaults")
+    parser.add_argument("--base", help="Base folder containing one subfolder per project")
+    parser.add_argument("--workers", action="append", default=[], metavar="STAGE=N",
+                        help="Worker count for a stage, e.g. --workers resize=8")
+    parser.add_argument("--enable", action="append", default=[], metavar="STAGE")
+    parser.add_argument("--disable", action="append", default=[], metavar="STAGE")
+    parser.add_argument("--queue-size", type=int, help="Max items buffered between stages")
+    parser.add_argument("--shard", help="Only process shard i of N of the panoramas, e.g. 0/4")
+    parser.add_argument("--print-config", action="store_true", help="Print the merged config and exit")
+    return parser.parse_args(argv)
+
+# Numba threading layers in order of preference for the project stage. The kernel
+# in projection_numba runs on worker threads, and with TBB the interpreter then
+# never exits; calls are serialised, so OpenMP or workqueue lose nothing.
+NUMBA_THREADING_LAYER_PRIORITY = "omp workqueue tbb"
+
+def main(argv=None):
+    if "NUMBA_THREADING_LAYER" not in os.environ:
+        # Read by numba when it is first imported, i.e. by the project stage
+        os.environ.setdefault("NUMBA_THREADING_LAYER_PRIORITY", NUMBA_THREADING_LAYER_PRIORITY)
+    args = parse_args(argv)
+    config = load_config(args.config)
+    if args.base:
+        config["base_folder"] = args.base
+    if args.queue_size:
+        config["queue_size"] = args.queue_size
+    if args.shard:
+        config["shard"] = args.shard
+    for spec in args.workers:
+        name, _, count = spec.partition("=")
+        if name not in config["stages"] or not count.isdigit():
+            raise SystemExit(f"Invalid --workers value: {spec}")
+        config["stages"][name]["workers"] = int(count)
+    for name in args.enable + args.disable:
+        if name not in config["stages"]:
+            raise SystemExit(f"Unknown stage: {name}")
+    for name in args.enable:
+        config["stages"][name]["enabled"] = True
+    for name in args.disable:
+        config["stages"][name]["enabled"] = False
+
+    if args.print_config:
+        print(json.dumps(config, indent=4))
+        return None
+    if not config["base_folder"]:
+        raise SystemExit("No base folder given (use --base or base_folder in the config)")
+    if config.get("shard"):
+        parse_shard(config["shard"])
+        for name in ("dataset", "push"):
+            if config["stages"][name].get("enabled", True):
+                # Per-project datasets would only hold this shard's frames
+                print(f"Sharded run: skipping the {name} stage, run it once all shards are verified")
+                config["stages"][name]["enabled"] = False
+
+    pipeline = build_pipeline(config)
+    print(f"Running stages: {' -> '.join(pipeline.order)}")
+    return pipeline.run(source_items(config))
+
+# Main execution
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Fused Numba kernel for the panorama -> perspective projection.
+
+The NumPy path in VR_pic_to_fill.compute_uv_numpy makes a dozen full-size
+passes (meshgrid, norm, stack, einsum, arctan2, arcsin, ...) and allocates a
+temporary for each of them. This kernel computes u / v for one pixel at a time
+in a single parallel pass, writing straight into the float32 maps cv2.remap
+takes. It is optional: importing this module raises ImportError when numba is
+not installed and VR_pic_to_fill falls back to NumPy.
+
+Calls to the kernel are serialised with a lock. Numba's workqueue threading
+layer, the only one available without TBB or OpenMP, aborts the process when
+two threads enter a parallel kernel at once, which the pipeline's project
+stage does with more than one worker. The kernel already uses every core, so
+extra project workers only overlap the panorama decoding and cv2.remap.
+
+Once the kernel has run on a worker thread, the TBB threading layer keeps the
+interpreter from exiting; pipeline.main therefore asks Numba to try TBB last.
+This module leaves the threading layer to the importing process.
+"""
+
+import math
+import threading
+
+import numpy as np
+from numba import njit, prange
+
+_kernel_lock = threading.Lock()
+
+@njit(parallel=True, cache=True)
+def _uv_kernel(xs, ys, rot, width, height, u, v):
+    two_pi = 2.0 * math.pi
+    for i in prange(ys.shape[0]):
+        yv = ys[i]
+        for j in range(xs.shape[0]):
+            xv = xs[j]
+
+            # Perspective distortion, same 0.1 factor as the NumPy path
+            z = 1.0 + xv * xv * 0.1
+            norm = math.sqrt(xv * xv + yv * yv + z * z)
+            px = xv / norm
+            py = yv / norm
+            pz = z / norm
+
+            rx = rot[0, 0] * px + rot[0, 1] * py + rot[0, 2] * pz
+            ry = rot[1, 0] * px + rot[1, 1] * py + rot[1, 2] * pz
+            rz = rot[2, 0] * px + rot[2, 1] * py + rot[2, 2] * pz
+            if ry > 1.0:
+                ry = 1.0
+            elif ry < -1.0:
+                ry = -1.0
+
+            phi = math.atan2(rx, rz)
+            theta = math.asin(ry)
+            u[i, j] = (phi / two_pi + 0.5) * width
+            v[i, j] = (theta / math.pi + 0.5) * height
+
+def compute_uv_numba(x, y, rot_mat, width, height):
+    """Panorama sampling coordinates (u, v) for every output pixel, fused Numba version"""
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    rot_mat = np.ascontiguousarray(rot_mat, dtype=np.float64)
+    u = np.empty((y.shape[0], x.shape[0]), dtype=np.float32)
+    v = np.empty((y.shape[0], x.shape[0]), dtype=np.float32)
+    with _kernel_lock:
+        _uv_kernel(x, y, rot_mat, float(width), float(height), u, v)
+    return u, v
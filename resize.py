@@ -5,21 +5,30 @@ Created on Mon Feb 24 13:11:54 2025
 @author: sijin
 """
 
+import argparse
 import os
 from PIL import Image
 from pathlib import Path
 
-def resize_frames_in_coho_folders(coho_base_path):
+from shard import in_shard, panorama_key, parse_shard, write_manifest
+
+def resize_frames_in_coho_folders(coho_base_path, shard=None):
     """
     Loop through each folder in the COHO directory, find the _frames folder,
-    and create a corresponding resize folder in the same location
+    and create a corresponding resize folder in the same location.
+    With shard="i/N" only the panorama frame folders hashed to shard i are
+    resized and a manifest is written for shard.verify_shards.
     """
+    shard = parse_shard(shard)
+    
     # Get all directories in the COHO base folder
     subfolders = [f for f in os.listdir(coho_base_path) 
-                  if os.path.isdir(os.path.join(coho_base_path, f))]
+                  if os.path.isdir(os.path.join(coho_base_path, f)) and not f.startswith('.')]
     
     total_success = 0
     total_errors = 0
+    done_keys = []
+    failed_keys = []
     
     for subfolder in subfolders:
         subfolder_path = os.path.join(coho_base_path, subfolder)
@@ -35,11 +44,25 @@ def resize_frames_in_coho_folders(coho_base_path):
         if os.path.exists(frames_folder_path) and os.path.isdir(frames_folder_path):
             print(f"\nProcessing frames in: {frames_folder_path}")
             
-            # Process images in the frames folder
-            success, errors = process_images(frames_folder_path, resize_folder_path)
-            
-            total_success += success
-            total_errors += errors
+            if shard is None:
+                # Process images in the frames folder
+                success, errors = process_images(frames_folder_path, resize_folder_path)
+                
+                total_success += success
+                total_errors += errors
+            else:
+                # Process this shard's panorama folders one by one
+                for panorama_name in sorted(os.listdir(frames_folder_path)):
+                    panorama_frames_path = os.path.join(frames_folder_path, panorama_name)
+                    key = panorama_key(subfolder, panorama_name)
+                    if not os.path.isdir(panorama_frames_path) or not in_shard(key, shard):
+                        continue
+                    success, errors = process_images(panorama_frames_path,
+                                                     os.path.join(resize_folder_path, panorama_name))
+                    total_success += success
+                    total_errors += errors
+                    # A panorama without any resized frame is not done either
+                    (failed_keys if errors or not success else done_keys).append(key)
             
             print(f"Completed processing frames for {subfolder}")
         else:
@@ -48,6 +71,8 @@ def resize_frames_in_coho_folders(coho_base_path):
     print(f"\nAll folders processed!")
     print(f"Total successfully resized: {total_success} images")
     print(f"Total errors: {total_errors} images")
+    if shard is not None:
+        write_manifest(coho_base_path, "resize", shard, done_keys, failed_keys)
     return total_success, total_errors
 
 def process_images(frames_folder_path, resize_folder_path):
@@ -104,5 +129,8 @@ def resize_image(image_path, output_path, max_size=(640, 360)):
 
 # Main execution
 if __name__ == "__main__":
-    coho_base_path = r"G:\Arcanite\ARC-PENTHOUSE"
-    resize_frames_in_coho_folders(coho_base_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Resize generated frames into each project's resize folder")
+    parser.add_argument("coho_base_path", nargs="?", default=r"G:\Arcanite\ARC-PENTHOUSE")
+    parser.add_argument("--shard", help="Only process shard i of N, e.g. 0/4")
+    args = parser.parse_args()
+    resize_frames_in_coho_folders(args.coho_base_path, shard=args.shard)
\ No newline at end of file
@@ -6,11 +6,11 @@ Created on Wed Mar 12 18:15:00 2025
 """
 
 import os
-import pandas as pd
-from pathlib import Path
-from PIL import Image
-from datasets import Dataset, Features, Sequence, Value, load_from_disk
-import json
+
+# pandas, datasets and the dedup helpers (NumPy/PIL) are imported where they are
+# used, so the pipeline can import this module without paying for them up front.
+from dataset_store import (adopt_saved_dataset, append_examples, is_store, known_ids, link_stores,
+                           rebuild_store)
 
 def load_descriptions(excel_path):
     """Load room descriptions from Excel file."""
@@ -19,6 +19,7 @@ def load_descriptions(excel_path):
         return {}
     
     try:
+        import pandas as pd
         df = pd.read_excel(excel_path)
         descriptions = {row['Place'].lower(): row['Depscription'] 
                        for _, row in df.iterrows() if pd.notna(row['Place'])}
@@ -34,6 +35,7 @@ def load_materials(excel_path):
         return {}
     
     try:
+        import pandas as pd
         df = pd.read_excel(excel_path)
         materials = {}
         for _, row in df.iterrows():
@@ -73,39 +75,80 @@ def format_materials_text(materials_list):
     
     return "\n".join(text_parts)
 
-def create_llama_dataset(base_path, descriptions_path, materials_path, project_name, coho_base_path):
-    """Create dataset in LLaMA Factory format"""
-    descriptions = load_descriptions(descriptions_path)
-    materials = load_materials(materials_path)
+def llama_examples_to_dataset(examples):
+    """Create a HuggingFace dataset from LLaMA Factory examples."""
+    from datasets import Dataset, Features, Sequence, Value
     
-    transformed_examples = []
+    features = Features({
+        'messages': Sequence({
+            'role': Value('string'),
+            'content': Value('string')
+        }),
+        'image_path': Value('string'),
+        'image_id': Value('string')
+    })
     
-    # Walk through all directories in the resize folder
-    for root, dirs, files in os.walk(base_path):
-        for file in files:
-            if file.endswith(('.jpg', '.jpeg', '.png')):
-                # Get path components
-                relative_path = os.path.relpath(root, base_path)
-                
-                # Extract room type from the path or filename
-                # This may need adjustment based on your exact folder structure
-                if '_' in relative_path:
-                    room_type = relative_path.split('_')[0].lower()
-                else:
-                    room_type = relative_path.lower()
-                
-                # Get image path using the base folder name from coho_base_path
-                base_folder_name = coho_base_path.split('\\')[-1]
-                image_path = f"/srv/scratch/dbgcse/sijin/LLaMA-Factory/{base_folder_name}/{project_name}/{relative_path}/{file}"
-                
-                
-                # Get descriptions
-                room_description = descriptions.get(room_type, "No specific description available.")
-                room_materials = materials.get(room_type, [])
-                materials_text = format_materials_text(room_materials)
-                
-                # Create prompt text
-                prompt_text = f"""Create a compelling, immersive VR narrative (one-short paragraph, under 100 words) using the **second person perspective** to give viewers an immersive experience, focusing on the {room_type} within {project_name}. Analyze the given image and room context:
+    if not examples:
+        # from_list cannot infer an empty table, e.g. when every frame is already stored
+        return Dataset.from_dict({name: [] for name in features}, features=features)
+    return Dataset.from_list(examples, features=features)
+
+def llama_image_id(project_name, relative_path, file):
+    """Stable id of a resized frame, independent of the machine and base path."""
+    return f"{project_name}/{relative_path}/{file}".replace('\\', '/')
+
+def llama_image_path_prefix(coho_base_path):
+    """Training-server folder of the images, using the base folder name from coho_base_path."""
+    base_folder_name = coho_base_path.split('\\')[-1]
+    return f"/srv/scratch/dbgcse/sijin/LLaMA-Factory/{base_folder_name}/"
+
+def legacy_llama_image_id(example, coho_base_path):
+    """
+    image_id of an example saved before the image_id column existed, recovered
+    from its image_path; None if the path is not under coho_base_path's folder.
+    """
+    prefix = llama_image_path_prefix(coho_base_path)
+    if not example['image_path'].startswith(prefix):
+        return None
+    return example['image_path'][len(prefix):].replace('\\', '/')
+
+def adopt_lora_dataset(dataset_output_path, coho_base_path):
+    """
+    Turn a <project>_lora_dataset saved by an earlier run into a dataset store,
+    recovering missing image_ids from image_path. Returns False when the ids
+    cannot be recovered and the dataset has to be rebuilt.
+    """
+    try:
+        adopt_saved_dataset(dataset_output_path,
+                            id_func=lambda example: example.get('image_id') or legacy_llama_image_id(example, coho_base_path))
+    except ValueError as e:
+        print(f"{str(e)}, the dataset will be rebuilt")
+        return False
+    return True
+
+def build_llama_example(file, relative_path, project_name, coho_base_path, descriptions, materials):
+    """
+    Build one LLaMA Factory example for an image at <resize>/<relative_path>/<file>
+    using the loaded room descriptions and materials.
+    """
+    # Extract room type from the path or filename
+    # This may need adjustment based on your exact folder structure
+    if '_' in relative_path:
+        room_type = relative_path.split('_')[0].lower()
+    else:
+        room_type = relative_path.lower()
+    
+    # Get image path using the base folder name from coho_base_path
+    image_path = f"{llama_image_path_prefix(coho_base_path)}{project_name}/{relative_path}/{file}"
+    
+    
+    # Get descriptions
+    room_description = descriptions.get(room_type, "No specific description available.")
+    room_materials = materials.get(room_type, [])
+    materials_text = format_materials_text(room_materials)
+    
+    # Create prompt text
+    prompt_text = f"""Create a compelling, immersive VR narrative (one-short paragraph, under 100 words) using the **second person perspective** to give viewers an immersive experience, focusing on the {room_type} within {project_name}. Analyze the given image and room context:
 
                                 Room Context:
                                 - The room is described as: {room_description}
@@ -121,36 +164,63 @@ def create_llama_dataset(base_path, descriptions_path, materials_path, project_n
                                 **- Room-Specific Guidance:**
                                     * **For Kitchens or Bathrooms:** Primarily focus your description on the materials used and practical items present (appliances, fixtures), and the *feelings* these functional aspects evoke in **you** (e.g., efficiency, cleanliness, luxury).
                                     * **For Balconies, Living Rooms, or Bedrooms:**  Consider and describe any outside views visible in the image, and how they influence the room's atmosphere and the *feelings* they inspire in **you** (e.g., tranquility, openness, coziness) as **you** look at them."""
+    
+    # Create example in LLaMA Factory format
+    example = {
+        'messages': [
+            {
+                'role': 'user',
+                'content': prompt_text
+            }
+        ],
+        'image_path': image_path,
+        'image_id': llama_image_id(project_name, relative_path, file)
+    }
+    
+    return example
+
+def create_llama_dataset(base_path, descriptions_path, materials_path, project_name, coho_base_path,
+                         dedup_threshold=None, skip_ids=None):
+    """
+    Create dataset in LLaMA Factory format.
+    If dedup_threshold is set, near-duplicate frames of each room (pHash Hamming
+    distance <= dedup_threshold) are dropped before building examples.
+    Frames whose image id is in skip_ids (e.g. already stored) are left out.
+    """
+    descriptions = load_descriptions(descriptions_path)
+    materials = load_materials(materials_path)
+    
+    transformed_examples = []
+    
+    # Walk through all directories in the resize folder
+    for root, dirs, files in os.walk(base_path):
+        files = sorted(files)
+        if dedup_threshold is not None:
+            from dedup import select_diverse_frames
+            image_files = [os.path.join(root, f) for f in files if f.endswith(('.jpg', '.jpeg', '.png'))]
+            kept = select_diverse_frames(image_files, threshold=dedup_threshold)
+            files = [os.path.basename(p) for p in kept]
+        for file in files:
+            if file.endswith(('.jpg', '.jpeg', '.png')):
+                # Get path components
+                relative_path = os.path.relpath(root, base_path)
+                if skip_ids and llama_image_id(project_name, relative_path, file) in skip_ids:
+                    continue
                 
-                # Create example in LLaMA Factory format
-                example = {
-                    'messages': [
-                        {
-                            'role': 'user',
-                            'content': prompt_text
-                        }
-                    ],
-                    'image_path': image_path
-                }
-                
+                example = build_llama_example(file, relative_path, project_name, coho_base_path,
+                                              descriptions, materials)
                 transformed_examples.append(example)
     
-    # Create dataset
-    features = Features({
-        'messages': Sequence({
-            'role': Value('string'),
-            'content': Value('string')
-        }),
-        'image_path': Value('string')
-    })
-    
-    dataset = Dataset.from_list(transformed_examples, features=features)
-    return dataset
+    return llama_examples_to_dataset(transformed_examples)
 
-def process_coho_folders_for_dataset(coho_base_path):
+def process_coho_folders_for_dataset(coho_base_path, dedup_threshold=10, incremental=False):
     """
     Loop through each folder in the COHO directory, find the resize folder and Excel files,
-    create datasets, and save them in a lora_dataset folder
+    create datasets, and save them in a lora_dataset folder.
+    Near-duplicate frames are filtered per room; pass dedup_threshold=None to keep all frames.
+    With incremental=True only frames not yet in a dataset are added, as a new
+    shard of each <subfolder>_lora_dataset store, and all stores are linked
+    into lora_dataset/combined_lora_dataset.
     """
     # Create the main lora_dataset folder
     lora_dataset_path = os.path.join(coho_base_path, "lora_dataset")
@@ -159,10 +229,12 @@ def process_coho_folders_for_dataset(coho_base_path):
     # Get all directories in the COHO base folder
     subfolders = [f for f in os.listdir(coho_base_path) 
                  if os.path.isdir(os.path.join(coho_base_path, f)) and 
-                 not f in ["lora_dataset"]]  # Exclude the lora_dataset folder itself
+                 not f in ["lora_dataset"] and  # Exclude the lora_dataset folder itself
+                 not f.startswith('.')]  # and shard manifests
     
     total_datasets = 0
     total_examples = 0
+    store_paths = []
     
     for subfolder in subfolders:
         subfolder_path = os.path.join(coho_base_path, subfolder)
@@ -181,30 +253,47 @@ def process_coho_folders_for_dataset(coho_base_path):
             
             # Create dataset
             try:
+                rebuild = not incremental or not adopt_lora_dataset(dataset_output_path, coho_base_path)
+                skip_ids = None if rebuild else known_ids(dataset_output_path)
                 dataset = create_llama_dataset(
                     resize_folder_path, 
                     descriptions_path, 
                     materials_path,
                     project_name=subfolder,
-                    coho_base_path=coho_base_path)
-                
-                # Save dataset
-                dataset.save_to_disk(dataset_output_path)
+                    coho_base_path=coho_base_path,
+                    dedup_threshold=dedup_threshold,
+                    skip_ids=skip_ids)
                 
-                # Print statistics
-                print(f"Dataset for {subfolder} created with {len(dataset)} examples")
+                if not rebuild:
+                    # Append new examples as a shard, keeping existing shards untouched
+                    appended = append_examples(dataset_output_path, dataset)
+                    store_paths.append(dataset_output_path)
+                    print(f"Dataset for {subfolder} updated with {appended} new examples")
+                    total_examples += appended
+                else:
+                    # Save dataset, replacing any earlier store so its index and shards do not outlive the rebuild
+                    rebuild_store(dataset_output_path, dataset)
+                    
+                    # Print statistics
+                    print(f"Dataset for {subfolder} created with {len(dataset)} examples")
+                    total_examples += len(dataset)
+                    store_paths.append(dataset_output_path)
                 total_datasets += 1
-                total_examples += len(dataset)
                 
             except Exception as e:
                 print(f"Error creating dataset for {subfolder}: {str(e)}")
         else:
             print(f"No resize folder found for {subfolder}, skipping dataset creation")
     
+    combined_path = os.path.join(lora_dataset_path, "combined_lora_dataset")
+    if store_paths and (incremental or is_store(combined_path)):
+        # An existing combined store is kept in sync with rebuilt datasets too
+        link_stores(combined_path, store_paths)
+    
     print(f"\nAll folders processed for dataset creation!")
     print(f"Created {total_datasets} datasets with a total of {total_examples} examples")
 
 # Main execution
 if __name__ == "__main__":
     coho_base_path = r"G:\Arcanite\ARC-PENTHOUSE"
-    process_coho_folders_for_dataset(coho_base_path)
\ No newline at end of file
+    process_coho_folders_for_dataset(coho_base_path, incremental=True)
\ No newline at end of file
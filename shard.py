@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Shard assignment for splitting projection and resizing across machines.
+
+Every panorama is identified by a stable key "<project>/<panorama name>" and
+assigned to shard sha1(key) % N, so any node can work out its slice of a tree
+on shared storage without a coordinator. Each shard writes a manifest under
+<base>/.shards; `verify` checks that the shards together covered every
+panorama exactly once and merges the manifests.
+
+Usage:
+    python VR_pic_to_fill.py "G:\\Arcanite\\ARC-PENTHOUSE" --shard 0/4     # on node 0
+    python shard.py verify "G:\\Arcanite\\ARC-PENTHOUSE" --stage project --num-shards 4
+    python shard.py run-local "G:\\Arcanite\\ARC-PENTHOUSE" --stage resize --num-shards 4
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+MANIFEST_FOLDER = ".shards"
+
+STAGE_SCRIPTS = {
+    "project": "VR_pic_to_fill.py",
+    "resize": "resize.py",
+}
+
+def parse_shard(spec):
+    """
+    Parse "i/N" into (i, N) with 0 <= i < N. None and (i, N) tuples pass through.
+    """
+    if spec is None or isinstance(spec, tuple):
+        return spec
+    try:
+        index, count = (int(part) for part in str(spec).split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}', need 0 <= i < N")
+    return index, count
+
+def panorama_key(project, panorama_name):
+    """Stable, machine-independent key of a panorama."""
+    return f"{project}/{panorama_name}".replace('\\', '/')
+
+def shard_of(key, num_shards):
+    """Shard index of a key; stable across machines and Python processes."""
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return int(digest[:16], 16) % num_shards
+
+def in_shard(key, shard):
+    """True if key belongs to shard (an (i, N) tuple); everything belongs to shard None."""
+    if shard is None:
+        return True
+    index, count = shard
+    return shard_of(key, count) == index
+
+def manifest_path(base_folder, stage, shard):
+    index, count = shard
+    return os.path.join(base_folder, MANIFEST_FOLDER, f"{stage}_{index}_of_{count}.json")
+
+def write_manifest(base_folder, stage, shard, done, failed):
+    """Record which panorama keys a shard processed."""
+    path = manifest_path(base_folder, stage, shard)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest = {
+        "stage": stage,
+        "shard": shard[0],
+        "num_shards": shard[1],
+        "done": sorted(done),
+        "failed": sorted(failed),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    print(f"Wrote shard manifest {path} ({len(done)} done, {len(failed)} failed)")
+    return path
+
+def list_projects(base_folder):
+    """Project subfolders of a base folder (skips manifests and dataset output)."""
+    return sorted(f for f in os.listdir(base_folder)
+                  if os.path.isdir(os.path.join(base_folder, f))
+                  and not f.startswith('.') and f != "lora_dataset")
+
+def expected_keys(base_folder, stage):
+    """Panorama keys a stage should have processed, derived from the tree itself."""
+    keys = set()
+    for project in list_projects(base_folder):
+        project_path = os.path.join(base_folder, project)
+        if stage == "project":
+            for f in os.listdir(project_path):
+                if f.lower().endswith('.jpg'):
+                    keys.add(panorama_key(project, os.path.splitext(f)[0]))
+        elif stage == "resize":
+            frames_folder = os.path.join(project_path, f"{project}_frames")
+            if os.path.isdir(frames_folder):
+                for d in os.listdir(frames_folder):
+                    if os.path.isdir(os.path.join(frames_folder, d)):
+                        keys.add(panorama_key(project, d))
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+    return keys
+
+def verify_shards(base_folder, stage, num_shards, write_merged=True):
+    """
+    Check that the shard manifests of a stage cover every expected panorama
+    exactly once, each on the shard its key hashes to. If everything checks
+    out and write_merged is set, a merged manifest is written next to them.
+    Returns True when the stage is complete.
+    """
+    expected = expected_keys(base_folder, stage)
+    seen = {}
+    failed = set()
+    problems = []
+
+    for index in range(num_shards):
+        path = manifest_path(base_folder, stage, (index, num_shards))
+        if not os.path.exists(path):
+            problems.append(f"Missing manifest for shard {index}/{num_shards}: {path}")
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        for key in manifest["done"]:
+            if key in seen:
+                problems.append(f"{key} processed by shards {seen[key]} and {index}")
+            elif shard_of(key, num_shards) != index:
+                problems.append(f"{key} processed by shard {index}, expected {shard_of(key, num_shards)}")
+            seen[key] = index
+        failed.update(manifest["failed"])
+
+    missing = expected - set(seen)
+    for key in sorted(missing):
+        reason = "failed" if key in failed else "not processed"
+        problems.append(f"{key} {reason}")
+
+    print(f"\nStage '{stage}': {len(seen)}/{len(expected)} panoramas processed across {num_shards} shards")
+    for problem in problems:
+        print(f"  {problem}")
+
+    ok = not problems
+    if ok and write_merged:
+        merged_path = os.path.join(base_folder, MANIFEST_FOLDER, f"{stage}_merged.json")
+        with open(merged_path, 'w', encoding='utf-8') as f:
+            json.dump({"stage": stage, "num_shards": num_shards,
+                       "shards": {key: seen[key] for key in sorted(seen)}}, f, indent=4)
+        print(f"All shards complete, merged manifest written to {merged_path}")
+    return ok
+
+def run_local(base_folder, stage, num_shards):
+    """Run all shards of a stage as separate local processes, then verify them."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), STAGE_SCRIPTS[stage])
+    processes = [subprocess.Popen([sys.executable, script, base_folder, "--shard", f"{i}/{num_shards}"])
+                 for i in range(num_shards)]
+    return_codes = [p.wait() for p in processes]
+    for index, code in enumerate(return_codes):
+        if code != 0:
+            print(f"Shard {index}/{num_shards} exited with code {code}")
+    return verify_shards(base_folder, stage, num_shards) and not any(return_codes)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify or locally run sharded pipeline stages")
+    parser.add_argument("command", choices=["verify", "run-local"])
+    parser.add_argument("base_folder")
+    parser.add_argument("--stage", choices=sorted(STAGE_SCRIPTS), required=True)
+    parser.add_argument("--num-shards", type=int, required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "verify":
+        ok = verify_shards(args.base_folder, args.stage, args.num_shards)
+    else:
+        ok = run_local(args.base_folder, args.stage, args.num_shards)
+    return 0 if ok else 1
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Training-ready tensor export for the LoRA dataset.
+
+The LoRA dataset only records image paths, so every training epoch decodes
+and resizes the JPEGs again in the dataloader. This module decodes each image
+once, letterboxes it to the model's input size and stores the uint8 pixels in
+fixed-shape .npy shards with a JSON index. Training nodes open the shards with
+np.load(mmap_mode='r') and read examples zero-copy through TensorShardDataset.
+
+Layout of an export directory:
+    index.json          size, shards and one entry per example (id, shard, row, messages)
+    pixels_00000.npy    uint8 array of shape (rows, height, width, 3)
+    pixels_00001.npy    ...
+
+Exports are incremental: the index is synced with the dataset's current rows.
+Entries whose image_id is no longer in the dataset (e.g. excluded by
+caption_validation --requeue) are dropped, entries whose messages changed
+(e.g. re-captioned) get the new messages, and new examples go to new shards.
+Pixels of dropped entries stay in their shard until the export is rebuilt.
+
+Usage:
+    python tensor_export.py "G:\\Arcanite\\ARC-PENTHOUSE\\lora_dataset\\combined_lora_dataset" "G:\\Arcanite\\ARC-PENTHOUSE" lora_tensors
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from caption_validation import message_list
+
+INDEX_FILE = "index.json"
+
+# Input size used by make_youtube_dataset_for_hfi_final_version_genmi.resize_image
+DEFAULT_SIZE = (518, 336)
+
+def letterbox(image_path, size=DEFAULT_SIZE):
+    """
+    Resize an image to fit size (width, height) keeping its aspect ratio and
+    pad it with black to exactly that size. Returns an (height, width, 3) uint8 array.
+    """
+    from PIL import Image
+    width, height = size
+    img = Image.open(image_path).convert('RGB')
+    ratio = min(width / img.size[0], height / img.size[1])
+    new_size = tuple(max(1, int(dim * ratio)) for dim in img.size)
+    resized_img = img.resize(new_size, Image.Resampling.LANCZOS)
+    canvas = Image.new('RGB', size)
+    canvas.paste(resized_img, ((width - new_size[0]) // 2, (height - new_size[1]) // 2))
+    return np.asarray(canvas, dtype=np.uint8)
+
+def local_image_path(example, coho_base_path):
+    """Local resized frame of a LoRA example, from its '<project>/<panorama>/<file>' image_id."""
+    project, relative = example['image_id'].split('/', 1)
+    return os.path.join(coho_base_path, project, "resize", *relative.split('/'))
+
+def load_export_index(output_dir):
+    path = os.path.join(output_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_export_index(output_dir, index):
+    path = os.path.join(output_dir, INDEX_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+
+def export_training_tensors(dataset, coho_base_path, output_dir, size=DEFAULT_SIZE,
+                            shard_size=1024, workers=8):
+    """
+    Export the images of a LoRA dataset as letterboxed uint8 pixel shards,
+    syncing an existing export with the dataset first. Returns the number of
+    examples added to the export.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    index = load_export_index(output_dir)
+    if index is None:
+        index = {"size": list(size), "shards": [], "examples": []}
+    elif tuple(index["size"]) != tuple(size):
+        raise ValueError(f"{output_dir} was exported at size {index['size']}, not {list(size)}")
+
+    live = {}
+    for example in dataset:
+        live[example['image_id']] = example
+
+    # Drop entries that left the dataset and pick up changed messages
+    examples = []
+    dropped = updated = 0
+    for entry in index["examples"]:
+        example = live.get(entry["image_id"])
+        if example is None:
+            dropped += 1
+            continue
+        messages = message_list(example['messages'])
+        if entry["messages"] != messages:
+            entry["messages"] = messages
+            updated += 1
+        examples.append(entry)
+    if dropped or updated:
+        index["examples"] = examples
+        _save_export_index(output_dir, index)
+        print(f"Dropped {dropped} and updated {updated} exported examples")
+
+    exported = {entry["image_id"] for entry in index["examples"]}
+    pending = [example for example_id, example in live.items() if example_id not in exported]
+    print(f"Exporting {len(pending)} new examples ({len(exported)} already exported)")
+
+    width, height = size
+    added = 0
+
+    def load(example):
+        try:
+            return letterbox(local_image_path(example, coho_base_path), size)
+        except Exception as e:
+            print(f"Error processing {example['image_id']}: {str(e)}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pending), shard_size):
+            chunk = pending[start:start + shard_size]
+            shard_file = f"pixels_{len(index['shards']):05d}.npy"
+            pixels = np.lib.format.open_memmap(os.path.join(output_dir, shard_file), mode='w+',
+                                               dtype=np.uint8, shape=(len(chunk), height, width, 3))
+            row = 0
+            entries = []
+            for example, array in zip(chunk, executor.map(load, chunk)):
+                if array is None:
+                    continue
+                pixels[row] = array
+                entries.append({
+                    "image_id": example['image_id'],
+                    "shard": len(index['shards']),
+                    "row": row,
+                    "messages": message_list(example['messages']),
+                })
+                row += 1
+            pixels.flush()
+            del pixels
+
+            # Rows left unused by failed images stay at the end of the shard
+            index["shards"].append({"file": shard_file, "num_rows": row})
+            index["examples"].extend(entries)
+            _save_export_index(output_dir, index)
+            added += row
+            print(f"Wrote {shard_file} with {row} examples")
+
+    print(f"Export complete: {len(index['examples'])} examples in {output_dir}")
+    return added
+
+class TensorShardDataset:
+    """
+    Read-only view of an export. Shards are memory-mapped, so indexing returns
+    a view of the pixels without decoding or copying.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.index = load_export_index(output_dir)
+        if self.index is None:
+            raise ValueError(f"No tensor export found in {output_dir}")
+        self._shards = {}
+
+    def _shard(self, number):
+        if number not in self._shards:
+            path = os.path.join(self.output_dir, self.index["shards"][number]["file"])
+            self._shards[number] = np.load(path, mmap_mode='r')
+        return self._shards[number]
+
+    def __len__(self):
+        return len(self.index["examples"])
+
+    def __getitem__(self, i):
+        entry = self.index["examples"][i]
+        return {
+            "pixels": self._shard(entry["shard"])[entry["row"]],
+            "messages": entry["messages"],
+            "image_id": entry["image_id"],
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a LoRA dataset as memory-mappable uint8 pixel shards")
+    parser.add_argument("dataset_path", help="LoRA dataset or dataset store")
+    parser.add_argument("coho_base_path", help="Base folder holding <project>/resize")
+    parser.add_argument("output_dir")
+    parser.add_argument("--size", default=f"{DEFAULT_SIZE[0]}x{DEFAULT_SIZE[1]}", help="Model input WIDTHxHEIGHT")
+    parser.add_argument("--shard-size", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    from dataset_store import load_store
+    size = tuple(int(part) for part in args.size.lower().split('x'))
+    dataset = load_store(args.dataset_path)
+    export_training_tensors(dataset, args.coho_base_path, args.output_dir, size=size,
+                            shard_size=args.shard_size, workers=args.workers)
+
+# Main execution
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+YouTube tour video -> category frame folders.
+
+Replaces the hand-made all_video_snapshots/<n>/<category> folders read by
+gemni_to_generate.py. For every category in <n>/captions.json the video is
+seeked to the start of the entry's time_range (OpenCV seeks to the preceding
+keyframe), frames in the range are sampled at a low rate with grab() so
+skipped frames are never converted, and a sampled frame is only written when
+its scene-change score against the last kept frame is high enough. Videos are
+processed in parallel, one process per video.
+
+Expected layout:
+    videos/3.mp4                               tour video of apartment 3
+    all_video_snapshots/3/captions.json        {"living room": [{"caption": ..., "time_range": "01:05-01:40"}]}
+    -> all_video_snapshots/3/living_room/frame_00065000.jpg, ...
+
+Usage:
+    python video_frames.py videos all_video_snapshots --workers 4
+"""
+
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.mov', '.avi')
+
+DEFAULT_SAMPLING = {
+    "sample_fps": 2.0,         # frames per second scored for scene changes
+    "threshold": 0.12,         # mean absolute thumbnail difference (0-1) that counts as a new view
+    "min_gap": 1.0,            # seconds between two kept frames
+    "max_frames": 8,           # per time range
+    "thumbnail_size": (64, 36),
+}
+
+def parse_timestamp(text):
+    """Parse 'SS', 'MM:SS' or 'HH:MM:SS' (optionally with fractions) into seconds."""
+    parts = text.strip().split(':')
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"Invalid timestamp: {text}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def parse_time_range(text):
+    """Parse a captions.json time_range such as '01:05-01:40' into (start, end) seconds, or None."""
+    if not text or not isinstance(text, str):
+        return None
+    parts = re.split(r"\s*(?:-|–|—|\bto\b)\s*", text.strip())
+    if len(parts) != 2:
+        return None
+    try:
+        start, end = parse_timestamp(parts[0]), parse_timestamp(parts[1])
+    except ValueError:
+        return None
+    if end <= start:
+        return None
+    return start, end
+
+def category_folder_name(category_display):
+    """Folder name for a category; gemni_to_generate maps '_' back to ' '."""
+    return category_display.strip().replace(' ', '_')
+
+def _thumbnail(frame, size):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+def scene_change_score(thumb_a, thumb_b):
+    """Mean absolute difference of two thumbnails, 0 (identical) to 1."""
+    return float(np.mean(np.abs(thumb_a - thumb_b)))
+
+def sample_scene_changes(cap, start, end, sample_fps=2.0, threshold=0.12, min_gap=1.0,
+                         max_frames=8, thumbnail_size=(64, 36)):
+    """
+    Return [(timestamp, frame)] of distinct views between start and end seconds.
+    The first sampled frame is always kept; later ones when they differ from the
+    last kept frame by at least threshold and are min_gap seconds after it.
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, int(round(fps / sample_fps)))
+
+    cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000.0)
+    frame_number = int(round(cap.get(cv2.CAP_PROP_POS_FRAMES)))
+    end_frame = int(end * fps)
+
+    kept = []
+    last_thumb = None
+    last_time = None
+    while frame_number <= end_frame and len(kept) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        timestamp = frame_number / fps
+        thumb = _thumbnail(frame, thumbnail_size)
+        if last_thumb is None or (scene_change_score(thumb, last_thumb) >= threshold
+                                  and timestamp - last_time >= min_gap):
+            kept.append((timestamp, frame))
+            last_thumb = thumb
+            last_time = timestamp
+
+        # Skip to the next sample without converting the frames in between
+        frame_number += 1
+        for _ in range(step - 1):
+            if frame_number > end_frame or not cap.grab():
+                break
+            frame_number += 1
+    return kept
+
+def extract_video(video_path, output_dir, captions_file=None, sampling=None):
+    """
+    Write scene-change frames of every captioned category of one video into
+    output_dir/<category>. Returns {category folder: frames written}.
+    """
+    sampling = dict(DEFAULT_SAMPLING, **(sampling or {}))
+    captions_file = captions_file or os.path.join(output_dir, "captions.json")
+    with open(captions_file, 'r', encoding='utf-8') as f:
+        captions = json.load(f)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open the video file: {video_path}")
+
+    written = {}
+    try:
+        for category_display, entries in captions.items():
+            folder = category_folder_name(category_display)
+            category_dir = os.path.join(output_dir, folder)
+            for entry in entries:
+                time_range = parse_time_range(entry.get("time_range", ""))
+                if time_range is None:
+                    print(f"  Skipping {category_display}: no usable time_range ({entry.get('time_range')!r})")
+                    continue
+                frames = sample_scene_changes(cap, *time_range,
+                                              sample_fps=sampling["sample_fps"],
+                                              threshold=sampling["threshold"],
+                                              min_gap=sampling["min_gap"],
+                                              max_frames=sampling["max_frames"],
+                                              thumbnail_size=tuple(sampling["thumbnail_size"]))
+                os.makedirs(category_dir, exist_ok=True)
+                for timestamp, frame in frames:
+                    output_path = os.path.join(category_dir, f"frame_{int(round(timestamp * 1000)):08d}.jpg")
+                    cv2.imwrite(output_path, frame)
+                written[folder] = written.get(folder, 0) + len(frames)
+    finally:
+        cap.release()
+
+    print(f"Extracted {sum(written.values())} frames in {len(written)} categories from {os.path.basename(video_path)}")
+    return written
+
+def find_videos(videos_dir):
+    """Map apartment number -> video path for videos named <n>.<ext>."""
+    videos = {}
+    for f in sorted(os.listdir(videos_dir)):
+        name, ext = os.path.splitext(f)
+        if name.isdigit() and ext.lower() in VIDEO_EXTENSIONS:
+            videos[name] = os.path.join(videos_dir, f)
+    return videos
+
+def extract_all_videos(videos_dir, snapshots_dir, workers=4, sampling=None):
+    """
+    Extract frames for every <n>.<ext> video that has snapshots_dir/<n>/captions.json,
+    one worker process per video. Returns {n: {category: frames written}}.
+    """
+    jobs = {}
+    for number, video_path in find_videos(videos_dir).items():
+        output_dir = os.path.join(snapshots_dir, number)
+        if not os.path.exists(os.path.join(output_dir, "captions.json")):
+            print(f"No captions.json for video {number}, skipping")
+            continue
+        jobs[number] = (video_path, output_dir)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(extract_video, video_path, output_dir, None, sampling): number
+                   for number, (video_path, output_dir) in jobs.items()}
+        for future in as_completed(futures):
+            number = futures[future]
+            try:
+                results[number] = future.result()
+            except Exception as e:
+                print(f"Error processing video {number}: {str(e)}")
+
+    total = sum(sum(counts.values()) for counts in results.values())
+    print(f"\nTotal: Extracted {total} frames from {len(results)}/{len(jobs)} videos")
+    return results
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract scene-change frames from tour videos into category folders")
+    parser.add_argument("videos_dir", nargs="?", default=r"G:\Arcanite\videos")
+    parser.add_argument("snapshots_dir", nargs="?", default=r"G:\Arcanite\all_video_snapshots")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--sample-fps", type=float, default=DEFAULT_SAMPLING["sample_fps"])
+    parser.add_argument("--threshold", type=float, default=DEFAULT_SAMPLING["threshold"])
+    parser.add_argument("--max-frames", type=int, default=DEFAULT_SAMPLING["max_frames"])
+    args = parser.parse_args()
+    extract_all_videos(args.videos_dir, args.snapshots_dir, workers=args.workers,
+                       sampling={"sample_fps": args.sample_fps, "threshold": args.threshold,
+                                 "max_frames": args.max_frames})